@@ -1,5 +1,8 @@
 __version__ = "1.0"
 
-from .benchlingapi import BenchlingAPI, BenchlingAPIException, AquariumLoginError, BenchlingLoginError
+from .benchlingapi import BenchlingAPI, BenchlingAPIException, AquariumLoginError, BenchlingLoginError, \
+    BenchlingServerError, CircuitOpenError
+from .sequence import SequenceHandle
+from .traces import TracePreprocessor
 from .convert import *
 #from .benchlingportal import BenchlingPortal
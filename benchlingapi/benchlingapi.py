@@ -6,11 +6,32 @@ from bs4 import BeautifulSoup
 import re
 import warnings
 import base64
+import threading
+from collections import OrderedDict
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor, Future
+from .index import compile_pattern, AnnotationIndex
+from .cache import ResponseCache, AccountSnapshot, AlignmentCache, DEFAULT_ALIGNMENT_CACHE
+import hashlib
+import sqlite3
+from .concurrency import SingleFlight, CircuitBreaker, hedged_call
+from .sequence import SequenceHandle
+from .traces import TracePreprocessor
+from . import sync
 
 class BenchlingAPIException(Exception):
     """Generic Exception for BenchlingAPI"""
 
 
+class BenchlingServerError(BenchlingAPIException):
+    """Benchling responded with a server error (5xx)"""
+
+
+class CircuitOpenError(BenchlingAPIException):
+    """Requests are failing fast because Benchling has been erroring"""
+
+
 class BenchlingLoginError(Exception):
     """Errors for incorrect login credentials"""
 
@@ -21,18 +42,20 @@ class AquariumLoginError(Exception):
 
 class RequestDecorator(object):
     """
-    Wraps a function to raise error with unexpected request status codes
+    Wraps a function to raise error with unexpected request status codes.
+    Returns the decoded json body, or the response itself if raw=True
     """
-    def __init__(self, status_codes):
+    def __init__(self, status_codes, raw=False):
         if not isinstance(status_codes, list):
             status_codes = [status_codes]
         self.code = status_codes
+        self.raw = raw
 
     def __call__(self, f):
         def wrapped_f(*args, **kwargs):
             args = list(args)
             args[1] = os.path.join(args[0].home, args[1])
-            r = f(*args)
+            r = f(*args, **kwargs)
             if r.status_code not in self.code:
                 http_codes = {
                     403: "FORBIDDEN",
@@ -43,8 +66,13 @@ class RequestDecorator(object):
                 msg = ""
                 if r.status_code in http_codes:
                     msg = http_codes[r.status_code]
-                raise BenchlingAPIException("HTTP Response Failed {} {}".format(
+                exception = BenchlingAPIException
+                if r.status_code >= 500:
+                    exception = BenchlingServerError
+                raise exception("HTTP Response Failed {} {}".format(
                     r.status_code, msg))
+            if self.raw:
+                return r
             return json.loads(r.text)
 
         return wrapped_f
@@ -89,25 +117,78 @@ class BenchlingAPI(object):
     Connects to BenchlingAPI
     """
 
+    EXECUTOR_THREAD_PREFIX = 'benchlingapi-worker'
+
     # TODO: Create SQLite Database for sequences
-    def __init__(self, api_key, home='https://api.benchling.com/v1/'):
+    def __init__(self, api_key, home='https://api.benchling.com/v1/',
+                 cache_size=32 * 1024 * 1024, cache_ttls=None, max_workers=8,
+                 refresh_interval=None, timeout=30, hedge_after=None,
+                 failure_threshold=5, reset_timeout=30, alignment_cache=DEFAULT_ALIGNMENT_CACHE):
         """
         BenchlingAPI connector
         :param api_key:
         :param home:
+        :param cache_size: size in bytes of the response cache for sequences and folders; 0 disables it
+        :param cache_ttls: dictionary of endpoint: seconds overriding the default cache ttls
+        :param max_workers: number of threads used for concurrent requests
+        :param refresh_interval: if set, seconds between background refreshes of the cached folders and sequences
+        :param timeout: seconds before a request times out; None waits forever
+        :param hedge_after: if set, seconds after which a slow GET is duplicated and the first response used
+        :param failure_threshold: consecutive failed requests before failing fast; None never fails fast
+        :param reset_timeout: seconds of failing fast before trying Benchling again
+        :param alignment_cache: sqlite file storing alignment results between runs, by default
+            ~/.benchlingapi/alignments.sqlite; ':memory:' keeps them for the life of the process
+            and None disables caching alignments
         """
         self.home = home
         self.auth = (api_key, '')
-        self.seq_dict = {}  # seq_name: seq_information
-        self.folder_dict = {}  # folder_name: folder_information
-        self.folders = []
-        self.sequences = []
+        self.response_cache = ResponseCache(max_bytes=cache_size, ttls=cache_ttls)
+        self.max_workers = max_workers
+        self._inflight = SingleFlight()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self.timeout = timeout
+        self.hedge_after = hedge_after
+        self._hedge_executor = None
+        self.breaker = CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+        self.alignment_cache = None
+        if alignment_cache is not None:
+            try:
+                self.alignment_cache = AlignmentCache(alignment_cache)
+            except (OSError, sqlite3.Error) as e:
+                if alignment_cache != DEFAULT_ALIGNMENT_CACHE:
+                    raise
+                warnings.warn("Could not open {}, alignments are only cached in memory: {}".format(
+                    alignment_cache, e))
+                self.alignment_cache = AlignmentCache(':memory:')
         self.proteins = []
+        self._snapshot = AccountSnapshot()
+        self._snapshot_lock = threading.Lock()
+        self._refresher = None
+        self._annotation_indexes = OrderedDict()
         try:
             self.update()
         except requests.ConnectionError:
             raise BenchlingLoginError('Benchling login credentials incorrect. Check \
                 BenchlinAPIKey: {}'.format(api_key))
+        if refresh_interval is not None:
+            self.start_refresher(refresh_interval)
+
+    @property
+    def folders(self):
+        return self._snapshot.folders
+
+    @property
+    def sequences(self):
+        return self._snapshot.sequences
+
+    @property
+    def seq_dict(self):
+        return self._snapshot.seq_dict
+
+    @property
+    def folder_dict(self):
+        return self._snapshot.folder_dict
 
     def update(self):
         """
@@ -118,24 +199,137 @@ class BenchlingAPI(object):
 
     @RequestDecorator([200, 201, 202])
     def _post(self, what, data):
-        return requests.post(what, json=data, auth=self.auth)
+        return self._send('post', what, json=data, auth=self.auth)
 
     @RequestDecorator([200, 201])
     def _patch(self, what, data):
-        return requests.patch(what, json=data, auth=self.auth)
+        return self._send('patch', what, json=data, auth=self.auth)
+
+    def _send(self, method, url, **kwargs):
+        """
+        Sends a request with the configured timeout through the circuit
+        breaker. GET requests are hedged if hedge_after is set.
+        :param method: 'get', 'post', 'patch' or 'delete'
+        :param url:
+        :param kwargs: keyword arguments for requests
+        :return: response
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("Benchling requests are failing; not sending {} {} for {}s".format(
+                method.upper(), url, self.breaker.reset_timeout))
+        kwargs.setdefault('timeout', self.timeout)
+        send = functools.partial(getattr(requests, method), url, **kwargs)
+        try:
+            if method == 'get' and self.hedge_after is not None:
+                if self._hedge_executor is None:
+                    self._hedge_executor = ThreadPoolExecutor(max_workers=2 * self.max_workers)
+                r = hedged_call(self._hedge_executor, send, self.hedge_after)
+            else:
+                r = send()
+        except BaseException:
+            # any error counts, so a failed half-open trial always reopens the circuit
+            self.breaker.record_failure()
+            raise
+        if r.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return r
+
+    def _coalesced_get(self, url, data, headers=None):
+        """
+        Sends a GET request, sharing the response with any identical
+        request already in flight from another thread
+        :param url:
+        :param data:
+        :param headers:
+        :return:
+        """
+        key = (url, json.dumps(data, sort_keys=True), json.dumps(headers, sort_keys=True))
+        return self._inflight.do(key, self._send, 'get', url, json=data, auth=self.auth, headers=headers)
 
     @RequestDecorator(200)
     def _get(self, what, data=None):
         if data is None:
             data = {}
-        return requests.get(what, json=data, auth=self.auth)
+        return self._coalesced_get(what, data)
+
+    @RequestDecorator([200, 304], raw=True)
+    def _get_response(self, what, data=None, headers=None):
+        if data is None:
+            data = {}
+        return self._coalesced_get(what, data, headers=headers)
+
+    @property
+    def executor(self):
+        """
+        Thread pool shared by concurrent api operations
+        :return:
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix=self.EXECUTOR_THREAD_PREFIX)
+        return self._executor
+
+    def run_async(self, method, *args, **kwargs):
+        """
+        Runs an api method in the shared thread pool and returns an asyncio
+        future, e.g. `await api.run_async(api.get_sequence, seq_id)`.
+        Concurrent identical reads are coalesced as with threads. Uses the
+        running event loop unless a loop is passed as loop=.
+        :param method:
+        :return:
+        """
+        loop = kwargs.pop('loop', None)
+        if loop is None:
+            loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, functools.partial(method, *args, **kwargs))
+
+    def _cached_get(self, what, data=None, revalidate=False):
+        """
+        Gets a resource through the response cache. Expired entries are
+        revalidated using their ETag or Last-Modified validators.
+        :param what:
+        :param data:
+        :param revalidate: revalidate the cached entry even if it has not
+            expired, and never serve it if the request fails
+        :return:
+        """
+        cache = self.response_cache
+        key = cache.key(what, data)
+        entry = cache.get(key)
+        if entry is not None and not entry.expired() and not revalidate:
+            return json.loads(entry.text)
+        headers = {}
+        if entry is not None:
+            headers = entry.validators()
+        try:
+            r = self._get_response(what, data=data, headers=headers)
+        except (CircuitOpenError, BenchlingServerError, requests.RequestException) as e:
+            # serve a stale response rather than failing while Benchling is erroring
+            if entry is None or revalidate:
+                raise
+            warnings.warn("Serving cached {} after request failed: {}".format(what, e))
+            return json.loads(entry.text)
+        if r.status_code == 304 and headers:
+            cache.refresh(key)
+            return json.loads(entry.text)
+        value = json.loads(r.text)
+        modified_at = None
+        if isinstance(value, dict):
+            modified_at = value.get('modified_at', value.get('modifiedAt'))
+        cache.put(key, what, r.text,
+                  etag=r.headers.get('ETag'),
+                  last_modified=r.headers.get('Last-Modified'),
+                  modified_at=modified_at)
+        return value
 
     @RequestDecorator(200)
     def _delete(self, what):
-        return requests.delete(what, auth=self.auth)
+        return self._send('delete', what, auth=self.auth)
 
-    # TODO add request decorator
-    @RequestDecorator(200)
+    @Verbose()
     def delete_folder(self, id):
         """
         Deletes a Benchling folder by id
@@ -143,7 +337,10 @@ class BenchlingAPI(object):
         :return:
         """
         # raise BenchlingAPIException("Benchling does not yet support deleting folders through the API")
-        return self._delete('folders/{}'.format(id))
+        d = self._delete('folders/{}'.format(id))
+        self.response_cache.invalidate('folders/{}'.format(id))
+        self._apply_local_changes(deleted_folders=[id])
+        return d
 
     @Verbose()
     def delete_sequence(self, id):
@@ -153,11 +350,13 @@ class BenchlingAPI(object):
         :return:
         """
         d = self._delete('sequences/{}'.format(id))
-        # TODO: Update dictionaries and lists after delete
+        self.response_cache.invalidate('sequences/{}'.format(id))
+        self.response_cache.invalidate_endpoint('folders')
+        self._apply_local_changes(deleted_sequences=[id])
         return d
 
     @Verbose()
-    def patch_folder(self, id, name=None, description=None, owner=None, type=type):
+    def patch_folder(self, id, name=None, description=None, owner=None, type=None):
         """
         Updates a folder with id
         :param name:
@@ -173,7 +372,10 @@ class BenchlingAPI(object):
             'type': type
         }
         self._clean_dictionary(payload)
-        return self._patch('folders/{}'.format(id))
+        p = self._patch('folders/{}'.format(id), payload)
+        self.response_cache.invalidate('folders/{}'.format(id))
+        self._apply_local_changes(patched_folders={id: payload})
+        return p
 
     @Verbose()
     def patch_sequence(self, id, name=None, bases=None, circular=None,
@@ -199,7 +401,118 @@ class BenchlingAPI(object):
             'color': color
         }
         self._clean_dictionary(payload)
-        return self._patch('sequences/{}'.format(id))
+        p = self._patch('sequences/{}'.format(id), payload)
+        self.response_cache.invalidate('sequences/{}'.format(id))
+        self.response_cache.invalidate_endpoint('folders')
+        self._apply_local_changes(patched_sequences={id: payload})
+        return p
+
+    def _bulk(self, fn, items, max_workers=None):
+        """
+        Calls fn(id, *args) for each (id, *args) tuple in items in the shared
+        executor, collecting failures instead of stopping at the first one.
+        At most max_workers calls of one bulk operation run at a time. When
+        called from a thread of the shared executor (e.g. through run_async)
+        the calls run one after another, since waiting on the executor from
+        its own threads could deadlock.
+        :param fn:
+        :param items:
+        :param max_workers: limit for this operation, at most api.max_workers
+        :return: dictionary with 'succeeded' ids and 'failed' id: error message
+        """
+        if max_workers is None:
+            max_workers = self.max_workers
+        report = {'succeeded': [], 'failed': {}}
+
+        def call(item):
+            try:
+                return fn(*item)
+            finally:
+                slots.release()
+
+        slots = threading.BoundedSemaphore(max_workers)
+        inline = threading.current_thread().name.startswith(self.EXECUTOR_THREAD_PREFIX)
+        futures = []
+        for item in items:
+            slots.acquire()
+            if inline:
+                future = Future()
+                try:
+                    future.set_result(call(item))
+                except Exception as e:
+                    future.set_exception(e)
+            else:
+                future = self.executor.submit(call, item)
+            futures.append((item[0], future))
+        for id, future in futures:
+            try:
+                future.result()
+                report['succeeded'].append(id)
+            except Exception as e:
+                report['failed'][id] = str(e)
+        return report
+
+    def delete_sequences(self, ids, max_workers=None):
+        """
+        Deletes many sequences concurrently
+        :param ids:
+        :param max_workers:
+        :return: dictionary with 'succeeded' ids and 'failed' id: error message
+        """
+        report = self._bulk(lambda id: self._delete('sequences/{}'.format(id)),
+                            [(id,) for id in ids], max_workers=max_workers)
+        for id in report['succeeded']:
+            self.response_cache.invalidate('sequences/{}'.format(id))
+        self.response_cache.invalidate_endpoint('folders')
+        self._apply_local_changes(deleted_sequences=report['succeeded'])
+        return report
+
+    def delete_folders(self, ids, max_workers=None):
+        """
+        Deletes many folders concurrently
+        :param ids:
+        :param max_workers:
+        :return: dictionary with 'succeeded' ids and 'failed' id: error message
+        """
+        report = self._bulk(lambda id: self._delete('folders/{}'.format(id)),
+                            [(id,) for id in ids], max_workers=max_workers)
+        for id in report['succeeded']:
+            self.response_cache.invalidate('folders/{}'.format(id))
+        self._apply_local_changes(deleted_folders=report['succeeded'])
+        return report
+
+    def patch_sequences(self, patches, max_workers=None):
+        """
+        Updates many sequences concurrently
+        :param patches: list of (id, fields) tuples, e.g. [('seq_x', {'name': 'new name'})]
+        :param max_workers:
+        :return: dictionary with 'succeeded' ids and 'failed' id: error message
+        """
+        patches = [(id, self._clean_dictionary(dict(fields))) for id, fields in patches]
+        report = self._bulk(lambda id, fields: self._patch('sequences/{}'.format(id), fields),
+                            patches, max_workers=max_workers)
+        for id in report['succeeded']:
+            self.response_cache.invalidate('sequences/{}'.format(id))
+        self.response_cache.invalidate_endpoint('folders')
+        succeeded = set(report['succeeded'])
+        self._apply_local_changes(patched_sequences={id: f for id, f in patches if id in succeeded})
+        return report
+
+    def patch_folders(self, patches, max_workers=None):
+        """
+        Updates many folders concurrently
+        :param patches: list of (id, fields) tuples, e.g. [('lib_x', {'name': 'new name'})]
+        :param max_workers:
+        :return: dictionary with 'succeeded' ids and 'failed' id: error message
+        """
+        patches = [(id, self._clean_dictionary(dict(fields))) for id, fields in patches]
+        report = self._bulk(lambda id, fields: self._patch('folders/{}'.format(id), fields),
+                            patches, max_workers=max_workers)
+        for id in report['succeeded']:
+            self.response_cache.invalidate('folders/{}'.format(id))
+        succeeded = set(report['succeeded'])
+        self._apply_local_changes(patched_folders={id: f for id, f in patches if id in succeeded})
+        return report
 
     @Verbose()
     def create_folder(self, name, description=None, folder_type='INVENTORY'):
@@ -255,6 +568,7 @@ class BenchlingAPI(object):
         # Post the sequence
         self._clean_dictionary(payload)
         self._post('sequences/', payload)
+        self.response_cache.invalidate('folders/{}'.format(folder))
 
         # Find the newly created sequence
         for seq in self.get_folder(folder)['sequences']:
@@ -294,22 +608,27 @@ class BenchlingAPI(object):
             return False
 
     @staticmethod
-    def _filter(item_list, fields, regex=False):
+    def _filter(item_list, fields, regex=False, index=None):
         """
         Filters a list of dictionaries based on a set
         of fields. Can search using regular expressions
         if requested. Uses the cached data stored in the api object.
+        If a TrigramIndex over item_list is given, only candidate items
+        returned by the index are checked.
         :param item_list:
         :param fields:
         :param regex:
+        :param index:
         :return:
         """
+        if index is not None:
+            item_list = index.candidates(fields, regex=regex)
         filtered_list = []
         for item in item_list:
             a = True
             for key in fields:
                 if regex:
-                    g = re.search(fields[key], item[key])
+                    g = compile_pattern(fields[key]).search(item[key])
                     if g is None:
                         a = False
                         break
@@ -321,15 +640,21 @@ class BenchlingAPI(object):
                 filtered_list.append(item)
         return filtered_list
 
-    def filter_sequences(self, fields, regex=False):
+    def filter_sequences(self, fields, regex=False, lazy=False):
         """
         Filters sequences based on a set of fields. Can search for
         regular expressions if requested. Uses the cached data stored in the api object.
         :param fields:
         :param regex:
+        :param lazy: return SequenceHandles that fetch the full sequence on first access,
+            including iterating or serializing them
         :return:
         """
-        return self._filter(self.sequences, fields, regex=regex)
+        snapshot = self._snapshot
+        sequences = self._filter(snapshot.sequences, fields, regex=regex, index=snapshot.indexes['sequences'])
+        if lazy:
+            return [SequenceHandle(self, s) for s in sequences]
+        return sequences
 
     def filter_folders(self, fields, regex=False):
         """
@@ -339,9 +664,10 @@ class BenchlingAPI(object):
         :param regex:
         :return:
         """
-        return self._filter(self.folders, fields, regex=regex)
+        snapshot = self._snapshot
+        return self._filter(snapshot.folders, fields, regex=regex, index=snapshot.indexes['folders'])
 
-    def _find(self, what, dict, value, query='name', regex=False):
+    def _find(self, what, dict, value, query='name', regex=False, index=None):
         """
         Uses the cached data stored in the api object to find the item
         :param what:
@@ -349,23 +675,25 @@ class BenchlingAPI(object):
         :param value:
         :param query:
         :param regex:
+        :param index:
         :return:
         """
-        item = self._find_cached_items(dict, query, regex, value)[0]
-        return self._get(os.path.join(what, item['id']))
+        item = self._find_cached_items(dict, query, regex, value, index=index)[0]
+        return self._cached_get(os.path.join(what, item['id']))
 
-    def _find_cached_items(self, dict, query, regex, value):
+    def _find_cached_items(self, dict, query, regex, value, index=None):
         """
         Uses the cached data stored in teh api object to find items
         :param dict:
         :param query:
         :param regex:
         :param value:
+        :param index:
         :return:
         """
         items = []
         try:
-            items = self._filter(dict, {query: value}, regex=regex)
+            items = self._filter(dict, {query: value}, regex=regex, index=index)
         except KeyError:
             raise BenchlingAPIException("Query {} not understood. Could not find item.".format(query))
         if len(items) == 0:
@@ -374,15 +702,24 @@ class BenchlingAPI(object):
             warnings.warn("More {} items found with {} \'{}\'. Returning first item.".format(len(items), query, value))
         return items
 
-    def find_sequence(self, value, query='name', regex=False):
+    def find_sequence(self, value, query='name', regex=False, lazy=False):
         """
         Finds a sequence based on a id, name, or regex+name query
         :param value:
         :param query:
         :param regex:
+        :param lazy: return a SequenceHandle over the cached metadata that only
+            fetches the full sequence when bases, annotations, etc. are accessed
+            or the handle is iterated or serialized
         :return:
         """
-        return self._find('sequences', self.sequences, value, query=query, regex=regex)
+        snapshot = self._snapshot
+        if lazy:
+            item = self._find_cached_items(snapshot.sequences, query, regex, value,
+                                           index=snapshot.indexes['sequences'])[0]
+            return SequenceHandle(self, item)
+        return self._find('sequences', snapshot.sequences, value, query=query, regex=regex,
+                          index=snapshot.indexes['sequences'])
 
     def find_folder(self, value, query='name', regex=False):
         """
@@ -392,10 +729,12 @@ class BenchlingAPI(object):
         :param regex:
         :return:
         """
-        return self._find('folders', self.folders, value, query=query, regex=regex)
+        snapshot = self._snapshot
+        return self._find('folders', snapshot.folders, value, query=query, regex=regex,
+                          index=snapshot.indexes['folders'])
 
     def get_folder(self, id):
-        return self._get('folders/{}'.format(id))
+        return self._cached_get('folders/{}'.format(id))
 
 
     def submit_mafft_alignment(self, seq_id, queries,
@@ -403,7 +742,8 @@ class BenchlingAPI(object):
                                max_iterations=0,
                                retree=2,
                                gap_open_penalty=1.53,
-                               gap_extension_penalty=0):
+                               gap_extension_penalty=0,
+                               preprocess=None):
 
         mafft_options = dict(
             adjust_direction=adjust_direction,
@@ -411,14 +751,15 @@ class BenchlingAPI(object):
             retree=retree,
             gap_open_penalty=gap_open_penalty,
             gap_extension_penalty=gap_extension_penalty)
-        return self.submit_alignment(seq_id, queries, 'mafft', mafft_options)
+        return self.submit_alignment(seq_id, queries, 'mafft', mafft_options, preprocess=preprocess)
 
     def submit_clustalo(self, seq_id, queries,
             max_guidetree_iterations=10,
             max_hmm_iterations=25,
             mbed_guide_tree="yes",
             mbed_iteration="yes",
-            num_combined_iterations=0):
+            num_combined_iterations=0,
+            preprocess=None):
 
         clustalo_options = dict(
             max_guidetree_iterations=max_guidetree_iterations,
@@ -428,10 +769,115 @@ class BenchlingAPI(object):
             num_combined_iterations=num_combined_iterations,
         )
 
-        return self.submit_alignment(seq_id, queries, 'clustalo', clustalo_options)
+        return self.submit_alignment(seq_id, queries, 'clustalo', clustalo_options, preprocess=preprocess)
+
+
+    def submit_alignment(self, seq_id, queries, algorithm, algorithm_options, use_cache=True, preprocess=None):
+        """
+        Submits an alignment of queries against the template sequence seq_id.
+        Identical alignments (same template version, query contents, algorithm
+        and options) submitted before are not resubmitted: the alignment is
+        returned if its task has succeeded, otherwise the original submission
+        response is returned while the task is still running.
+        :param seq_id: template sequence id
+        :param queries: sequence ids, file paths, encoded data or (name, data) tuples
+        :param algorithm:
+        :param algorithm_options:
+        :param use_cache: whether to use the alignment cache
+        :param preprocess: TracePreprocessor (or True for the default one) used to
+            trim .ab1 files locally and upload them as FASTA/FASTQ; failed reads are dropped
+        :return:
+        """
+        if preprocess is True:
+            preprocess = TracePreprocessor()
+        data = {
+            "algorithm": algorithm,
+            "algorithmOptions": algorithm_options,
+            "files": self._alignment_files(seq_id, queries, preprocess=preprocess)
+        }
+        if not use_cache or self.alignment_cache is None:
+            return self._post('alignments', data)
+
+        key = self.alignment_cache.key(self._alignment_key_parts(data))
+        cached = self.alignment_cache.get(key)
+        if cached is not None and cached['alignment'] is not None:
+            return cached['alignment']
+        if cached is not None and cached['task_id'] is not None:
+            try:
+                task = self.get_task(cached['task_id'])
+                if task.get('status') == 'SUCCEEDED':
+                    alignment = self._alignment_from_task(task)
+                    self.alignment_cache.set_alignment(key, alignment)
+                    return alignment
+                if task.get('status') != 'FAILED':
+                    return cached['response']
+            except (BenchlingServerError, CircuitOpenError):
+                raise
+            except BenchlingAPIException as e:
+                # the task or alignment is gone (e.g. expired), so submit again
+                warnings.warn("Resubmitting alignment, could not get task {}: {}".format(cached['task_id'], e))
+        self.alignment_cache.remove(key)
+        response = self._post('alignments', data)
+        task_id = response.get('taskId', response.get('task_id', response.get('id')))
+        if task_id is not None:
+            self.alignment_cache.put(key, task_id, response)
+        return response
+
+    def _alignment_key_parts(self, data):
+        """
+        Everything that determines the result of an alignment: the account,
+        the versions of referenced sequences, hashes of uploaded data,
+        algorithm and options
+        :param data: alignment request payload
+        :return:
+        """
+        account = {'home': self.home, 'key': hashlib.sha256(self.auth[0].encode('utf-8')).hexdigest()}
+        files = []
+        for f in data['files']:
+            if 'id' in f:
+                files.append({'id': f['id'], 'version': self._sequence_version(f['id'])})
+            else:
+                content = f['data']
+                if isinstance(content, str):
+                    content = content.encode('utf-8')
+                files.append({'name': f['name'], 'sha256': hashlib.sha256(content).hexdigest()})
+        return {'account': account, 'algorithm': data['algorithm'],
+                'algorithmOptions': data['algorithmOptions'], 'files': files}
+
+    def _sequence_version(self, seq_id):
+        """
+        Identifies the current version of a sequence. The cached sequence is
+        always revalidated, so an unchanged sequence costs a 304 rather than
+        a download and an edited one is never identified by a stale version.
+        :param seq_id:
+        :return:
+        """
+        sequence = self._cached_get('sequences/{}'.format(seq_id), revalidate=True)
+        modified_at = sequence.get('modifiedAt', sequence.get('modified_at'))
+        if modified_at is not None:
+            return modified_at
+        return hashlib.sha256(sequence['bases'].encode('utf-8')).hexdigest()
 
+    def _alignment_from_task(self, task):
+        """
+        Gets the alignment created by a succeeded alignment task
+        :param task:
+        :return:
+        """
+        response = task.get('response') or {}
+        alignment_id = response.get('id', response.get('alignmentId'))
+        if alignment_id is None:
+            return response
+        return self.get_alignment(alignment_id)
 
-    def submit_alignment(self, seq_id, queries, algorithm, algorithm_options):
+    def _alignment_files(self, seq_id, queries, preprocess=None):
+        """
+        Alignment request files for the template and queries
+        :param seq_id:
+        :param queries:
+        :param preprocess:
+        :return:
+        """
         files = [{'id': seq_id}]
         i = 0
 
@@ -453,11 +899,21 @@ class BenchlingAPI(object):
                     files.append(dict(
                         id=q
                     ))
+                # if the query is a trace file to preprocess, trim it locally
+                elif preprocess is not None and os.path.exists(q) and preprocess.accepts(q):
+                    trimmed = preprocess(q)
+                    if trimmed is None:
+                        warnings.warn("Dropping failed read {}".format(q))
+                        continue
+                    files.append(dict(
+                        name=trimmed[0],
+                        data=trimmed[1]
+                    ))
                 # if the query is a file, encode the data
                 elif os.path.exists(q):
                     data64=None
-                    with open(q) as f:
-                        data64 = base64.b64encode(f.read())
+                    with open(q, 'rb') as f:
+                        data64 = base64.b64encode(f.read()).decode('ascii')
                     files.append(dict(
                         name=os.path.basename(q),
                         data=data64
@@ -469,13 +925,9 @@ class BenchlingAPI(object):
                         data=q
                     ))
                     i += 1
-
-        data = {
-            "algorithm": algorithm,
-            "algorithmOptions": algorithm_options,
-            "files": files
-        }
-        return self._post('alignments', data)
+        if len(files) == 1:
+            raise BenchlingAPIException("No queries left to align against {}.".format(seq_id))
+        return files
 
     # TODO: submit batched alignments that auto-updates once tasks are complete
     def submit_batched_alignment(self):
@@ -500,19 +952,63 @@ class BenchlingAPI(object):
             if a['end'] == 0:
                 a['end'] = len(sequence['bases'])
 
-    def get_sequence(self, seq_id, data=None):
+    def get_sequence(self, seq_id, data=None, metadata_only=False):
         """
         Get a sequence from a sequence id
         :param seq_id:
         :param data:
+        :param metadata_only: only return the id, name and folder of the sequence.
+            The API has no partial sequence responses, so these come from the
+            folder listing, which is refreshed once if the sequence is not cached.
         :return:
         """
+        if metadata_only:
+            return self._get_sequence_metadata(seq_id)
         if data is None:
             data = {}
-        sequence = self._get('sequences/{}'.format(seq_id), data=data)
+        sequence = self._cached_get('sequences/{}'.format(seq_id), data=data)
         self._clean_annotations(sequence)
         return sequence
 
+    def annotation_index(self, sequence, max_cached=128):
+        """
+        Interval index over the annotations of a sequence for overlap and
+        containment queries. Indexes are cached per sequence id and version.
+        :param sequence: fetched sequence or sequence id
+        :param max_cached: number of indexes to keep cached
+        :return: AnnotationIndex
+        """
+        if isinstance(sequence, str):
+            sequence = self.get_sequence(sequence)
+        key = (sequence['id'], sequence.get('modifiedAt', sequence.get('modified_at')),
+               len(sequence['bases']), len(sequence['annotations']))
+        with self._snapshot_lock:
+            index = self._annotation_indexes.get(key)
+            if index is not None:
+                self._annotation_indexes.move_to_end(key)
+                return index
+        index = AnnotationIndex(sequence)
+        with self._snapshot_lock:
+            self._annotation_indexes[key] = index
+            while len(self._annotation_indexes) > max_cached:
+                self._annotation_indexes.popitem(last=False)
+        return index
+
+    def _get_sequence_metadata(self, seq_id):
+        """
+        Cached metadata of a sequence from the folder listing
+        :param seq_id:
+        :return:
+        """
+        for refresh in [False, True]:
+            if refresh:
+                self.update()
+            snapshot = self._snapshot
+            found = self._filter(snapshot.sequences, {'id': seq_id}, index=snapshot.indexes['sequences'])
+            if found:
+                return dict(found[0])
+        raise BenchlingAPIException("No sequence found with id \'{}\'.".format(seq_id))
+
     @staticmethod
     def _clean_dictionary(dic):
         """
@@ -612,36 +1108,154 @@ class BenchlingAPI(object):
         Clears the api cache
         :return:
         """
-        self.folders = []
-        self.sequences = []
-        self.seq_dict = {}
-        self.folder_dict = {}
-
-    def _updatelistsfromdictionaries(self):
-        for f in self.folders:
-            seqs = f['sequences']
-            if f['name'] not in self.folder_dict:
-                self.folder_dict[f['name']] = []
-            self.folder_dict[f['name']].append(f)
-            for s in seqs:
-                s['folder'] = f['id']
-                if s not in self.sequences:
-                    self.sequences.append(s)
-                if s['name'] not in self.seq_dict:
-                    self.seq_dict[s['name']] = []
-                self.seq_dict[s['name']].append(s)
+        self._snapshot = AccountSnapshot()
 
     def _update_dictionaries(self):
         """
-        Updates the dictionary cache for the api
+        Updates the dictionary cache for the api. The new folders and sequences
+        are published at once, so readers keep seeing the previous cache
+        until the refresh is complete.
         :return:
         """
-        self._clear()
         r = self._get('folders')
         if 'error' in r:
             raise requests.ConnectionError('Benchling Authentication Required. Check your Benchling API key.')
-        self.folders = r['folders']
-        self._updatelistsfromdictionaries()
+        for f in r['folders']:
+            self.response_cache.revalidate('folders/{}'.format(f['id']), f.get('modified_at', f.get('modifiedAt')))
+        snapshot = AccountSnapshot(r['folders'])
+        with self._snapshot_lock:
+            self._snapshot = snapshot
+
+    def start_refresher(self, interval=60):
+        """
+        Refreshes the cached folders and sequences in a background thread
+        every interval seconds. The previous cache keeps being served while
+        refreshing and when a refresh fails.
+        :param interval: seconds between refreshes
+        :return:
+        """
+        self.stop_refresher()
+        stop = threading.Event()
+
+        def refresh():
+            while not stop.wait(interval):
+                try:
+                    self.update()
+                except Exception as e:
+                    warnings.warn("Background refresh of the Benchling cache failed: {}".format(e))
+
+        thread = threading.Thread(target=refresh, name='benchlingapi-refresher')
+        thread.daemon = True
+        self._refresher = (thread, stop)
+        thread.start()
+
+    def stop_refresher(self):
+        """
+        Stops the background refresher, if running
+        :return:
+        """
+        if self._refresher is not None:
+            thread, stop = self._refresher
+            stop.set()
+            thread.join()
+            self._refresher = None
+
+    def _apply_local_changes(self, deleted_sequences=(), deleted_folders=(),
+                             patched_sequences=None, patched_folders=None):
+        """
+        Applies deletes and patches made by this client to the cached folders
+        and sequences without refetching them, then rebuilds the lists,
+        dictionaries and indexes in one pass
+        :param deleted_sequences: sequence ids
+        :param deleted_folders: folder ids
+        :param patched_sequences: dictionary of sequence id: patched fields
+        :param patched_folders: dictionary of folder id: patched fields
+        :return:
+        """
+        patched_sequences = patched_sequences or {}
+        patched_folders = patched_folders or {}
+        deleted_sequences = set(deleted_sequences)
+        deleted_folders = set(deleted_folders)
+        with self._snapshot_lock:
+            self._snapshot = AccountSnapshot(self._patched_folders(
+                deleted_sequences, deleted_folders, patched_sequences, patched_folders))
+
+    def _patched_folders(self, deleted_sequences, deleted_folders, patched_sequences, patched_folders):
+        """
+        Copy of the cached folder listing with local changes applied
+        :return:
+        """
+        folders = []
+        for f in self._snapshot.folders:
+            if f['id'] in deleted_folders:
+                continue
+            f = dict(f)
+            for key in ['name', 'description']:
+                if key in patched_folders.get(f['id'], {}):
+                    f[key] = patched_folders[f['id']][key]
+            folders.append(f)
+        moved = []
+        for f in folders:
+            seqs = []
+            for s in f['sequences']:
+                if s['id'] in deleted_sequences:
+                    continue
+                s = dict(s)
+                fields = patched_sequences.get(s['id'], {})
+                if 'name' in fields:
+                    s['name'] = fields['name']
+                if fields.get('folder', f['id']) != f['id']:
+                    moved.append((fields['folder'], s))
+                    continue
+                seqs.append(s)
+            f['sequences'] = seqs
+        by_id = {f['id']: f for f in folders}
+        for folder_id, s in moved:
+            if folder_id in by_id:
+                by_id[folder_id]['sequences'].append(s)
+        return folders
+
+    def sequences_containing(self, substring, query='name'):
+        """
+        Finds cached sequences whose field contains the substring
+        :param substring:
+        :param query:
+        :return:
+        """
+        return self._snapshot.indexes['sequences'].contains(query, substring)
+
+    def folders_containing(self, substring, query='name'):
+        """
+        Finds cached folders whose field contains the substring
+        :param substring:
+        :param query:
+        :return:
+        """
+        return self._snapshot.indexes['folders'].contains(query, substring)
+
+    def mirror(self, dest_dir, **kwargs):
+        """
+        Mirrors all folders and sequences of the account to a local
+        directory as json and GenBank files. Interrupted mirrors resume
+        and later runs only refetch changed sequences. See sync.mirror.
+        :param dest_dir:
+        :param kwargs:
+        :return: report dictionary
+        """
+        return sync.mirror(self, dest_dir, **kwargs)
+
+    def sync_folder(self, local_dir, folder_id, dry_run=False, **kwargs):
+        """
+        Makes a Benchling folder match a directory of GenBank files, only
+        creating, patching or deleting the sequences that differ. With
+        dry_run=True only the plan is returned. See sync.sync_folder.
+        :param local_dir:
+        :param folder_id:
+        :param dry_run:
+        :param kwargs:
+        :return: dictionary with the 'plan' and any 'failed' actions
+        """
+        return sync.sync_folder(self, local_dir, folder_id, dry_run=dry_run, **kwargs)
 
     def search(self, query, querytype='text', limit=10, offset=0):
         """
@@ -0,0 +1,302 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .index import TrigramIndex
+
+DEFAULT_ALIGNMENT_CACHE = os.path.join(os.path.expanduser('~'), '.benchlingapi', 'alignments.sqlite')
+
+
+class CacheEntry(object):
+    """
+    A cached response body along with its validators
+    """
+    __slots__ = ('what', 'text', 'size', 'expires', 'etag', 'last_modified', 'modified_at')
+
+    def __init__(self, what, text, ttl, etag=None, last_modified=None, modified_at=None):
+        self.what = what
+        self.text = text
+        self.size = len(text.encode('utf-8'))
+        self.expires = time.time() + ttl
+        self.etag = etag
+        self.last_modified = last_modified
+        self.modified_at = modified_at
+
+    def expired(self):
+        return time.time() >= self.expires
+
+    def validators(self):
+        """
+        Conditional request headers for revalidating this entry
+        :return:
+        """
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache(object):
+    """
+    In-process LRU cache of GET responses bounded by the total size of the
+    cached bodies in bytes. Entries expire after a per-endpoint TTL and are
+    then revalidated rather than dropped.
+    """
+
+    DEFAULT_TTLS = {
+        'sequences': 300,
+        'folders': 60,
+    }
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttls=None, default_ttl=60):
+        """
+        ResponseCache constructor
+        :param max_bytes: maximum total size of cached bodies; 0 disables the cache
+        :param ttls: dictionary of endpoint: seconds, e.g. {'sequences': 300}
+        :param default_ttl: ttl for endpoints not in ttls
+        """
+        self.max_bytes = max_bytes
+        self.ttls = dict(self.DEFAULT_TTLS)
+        if ttls is not None:
+            self.ttls.update(ttls)
+        self.default_ttl = default_ttl
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def endpoint(what):
+        """
+        The endpoint of a request path, e.g. 'sequences' for 'sequences/seq_x'
+        :param what:
+        :return:
+        """
+        return what.strip('/').split('/')[0]
+
+    @staticmethod
+    def key(what, data=None):
+        """
+        Cache key for a request path and payload
+        :param what:
+        :param data:
+        :return:
+        """
+        what = what.strip('/')
+        if not data:
+            return what
+        return '{}?{}'.format(what, json.dumps(data, sort_keys=True))
+
+    def ttl(self, what):
+        return self.ttls.get(self.endpoint(what), self.default_ttl)
+
+    def get(self, key):
+        """
+        Returns the entry for key, expired or not, or None
+        :param key:
+        :return:
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, what, text, etag=None, last_modified=None, modified_at=None):
+        """
+        Caches a response body, evicting least recently used entries
+        until the cache fits in max_bytes
+        :param key:
+        :param what:
+        :param text:
+        :param etag:
+        :param last_modified:
+        :param modified_at:
+        :return:
+        """
+        entry = CacheEntry(what.strip('/'), text, self.ttl(what),
+                           etag=etag, last_modified=last_modified, modified_at=modified_at)
+        with self._lock:
+            self._remove(key)
+            if entry.size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self.size -= old.size
+
+    def refresh(self, key):
+        """
+        Marks an entry as fresh after a successful revalidation
+        :param key:
+        :return:
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.expires = time.time() + self.ttl(entry.what)
+
+    def revalidate(self, what, modified_at):
+        """
+        Compares the modification time of a cached entity with a known
+        modification time (e.g. from a folder listing). Refreshes the
+        entry if unchanged, otherwise invalidates it.
+        :param what:
+        :param modified_at:
+        :return:
+        """
+        if modified_at is None:
+            return
+        with self._lock:
+            entry = self._entries.get(what.strip('/'))
+            if entry is None or entry.modified_at is None:
+                return
+            if entry.modified_at == modified_at:
+                self.refresh(entry.what)
+            else:
+                self.invalidate(what)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def invalidate(self, what):
+        """
+        Removes all entries for a request path, regardless of payload
+        :param what:
+        :return:
+        """
+        what = what.strip('/')
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e.what == what]:
+                self._remove(key)
+
+    def invalidate_endpoint(self, endpoint):
+        """
+        Removes all entries for an endpoint, e.g. 'folders'
+        :param endpoint:
+        :return:
+        """
+        with self._lock:
+            for key in [k for k in self._entries if self.endpoint(k) == endpoint]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class AccountSnapshot(object):
+    """
+    The cached folders and sequences of an account along with their lookup
+    dictionaries and indexes. A snapshot is never modified once built;
+    changes are made by building a new snapshot and publishing it by
+    reference, so concurrent readers always see a complete snapshot.
+    """
+
+    def __init__(self, folders=None):
+        """
+        Builds the snapshot from a folder listing
+        :param folders: list of folders, each with a list of sequences
+        """
+        self.folders = folders or []
+        self.sequences = []
+        self.seq_dict = {}  # seq_name: seq_information
+        self.folder_dict = {}  # folder_name: folder_information
+        self.created = time.time()
+        seq_ids = set()
+        for f in self.folders:
+            self.folder_dict.setdefault(f['name'], []).append(f)
+            for s in f['sequences']:
+                s['folder'] = f['id']
+                if s['id'] not in seq_ids:
+                    seq_ids.add(s['id'])
+                    self.sequences.append(s)
+                self.seq_dict.setdefault(s['name'], []).append(s)
+        self.indexes = {
+            'folders': TrigramIndex(self.folders),
+            'sequences': TrigramIndex(self.sequences)
+        }
+
+    def age(self):
+        return time.time() - self.created
+
+
+class AlignmentCache(object):
+    """
+    Persistent store of alignment submissions and their results, keyed by a
+    hash of everything that determines the alignment. Backed by sqlite so
+    results survive between runs when a file path is given.
+    """
+
+    def __init__(self, path=':memory:'):
+        """
+        AlignmentCache constructor
+        :param path: sqlite database file, or ':memory:' for a cache that lasts as long as the process
+        """
+        self.path = path
+        if path != ':memory:' and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS alignments ('
+                'key TEXT PRIMARY KEY, task_id TEXT, response TEXT, alignment TEXT, created REAL)')
+
+    @staticmethod
+    def key(parts):
+        """
+        Hash of the json serializable alignment inputs
+        :param parts:
+        :return:
+        """
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Returns a dictionary with the task_id, submission response and
+        alignment (None until known) for key, or None
+        :param key:
+        :return:
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT task_id, response, alignment FROM alignments WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'task_id': row[0],
+            'response': json.loads(row[1]),
+            'alignment': None if row[2] is None else json.loads(row[2])
+        }
+
+    def put(self, key, task_id, response):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO alignments (key, task_id, response, alignment, created) '
+                'VALUES (?, ?, ?, NULL, ?)', (key, task_id, json.dumps(response), time.time()))
+
+    def set_alignment(self, key, alignment):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE alignments SET alignment = ? WHERE key = ?', (json.dumps(alignment), key))
+
+    def remove(self, key):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM alignments WHERE key = ?', (key,))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM alignments')
@@ -0,0 +1,141 @@
+import threading
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+
+
+class _Call(object):
+    """
+    An in-flight call shared between a leader and its waiters
+    """
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls with the same key into one call. The first
+    caller runs the function; callers arriving while it is in flight wait
+    and receive the same result, or have the same exception raised.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Calls fn(*args, **kwargs) unless a call with the same key is already
+        in flight, in which case waits for and returns its result
+        :param key: hashable key identifying the call
+        :param fn:
+        :return:
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+def hedged_call(pool, fn, delay):
+    """
+    Calls fn in the pool and, if it has not completed after delay seconds,
+    starts an identical second call. Returns the result of whichever call
+    succeeds first; raises the first error if both fail. Only use for
+    idempotent calls.
+    :param pool: executor
+    :param fn: function without arguments
+    :param delay: seconds to wait before hedging
+    :return:
+    """
+    first = pool.submit(fn)
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+    pending = set([first, pool.submit(fn)])
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for f in done:
+            if f.exception() is None:
+                return f.result()
+            if error is None:
+                error = f.exception()
+    raise error
+
+
+class CircuitBreaker(object):
+    """
+    Tracks consecutive request failures. After failure_threshold failures
+    the circuit opens and requests should fail fast; after reset_timeout
+    seconds a single trial request is let through, closing the circuit if
+    it succeeds and reopening it if it fails.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        """
+        CircuitBreaker constructor
+        :param failure_threshold: consecutive failures before opening; None never opens
+        :param reset_timeout: seconds before letting a trial request through
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Whether a request may be sent now
+        :return:
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failure_threshold is None:
+                return
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.time()
@@ -3,7 +3,12 @@ from Bio.SeqFeature import *
 from Bio.SeqIO import *
 from Bio.Seq import *
 from Bio.Alphabet import generic_dna
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import copy
+import functools
+import itertools
+import os
 
 
 def encode_dictionary(dictionary):
@@ -17,9 +22,19 @@ def encode_dictionary(dictionary):
 
 def _convert_benchling_features(benchling_seq):
     seqfeatures = []
+    length = len(benchling_seq['bases'])
     for ftr in benchling_seq['annotations']:
+        start, end = ftr['start'], ftr['end']
+        if end == 0:
+            end = length
+        if start > end:
+            # feature wraps around the origin of a circular sequence
+            location = CompoundLocation([FeatureLocation(start, length, strand=ftr['strand']),
+                                         FeatureLocation(0, end, strand=ftr['strand'])])
+        else:
+            location = FeatureLocation(start, end)
         info = \
-            dict(location=FeatureLocation(ftr['start'], ftr['end']), type=ftr['type'], strand=ftr['strand'],
+            dict(location=location, type=ftr['type'], strand=ftr['strand'],
                  id=ftr['name'], qualifiers={
                     'label': ftr['name'],
                     'ApEinfo_fwdcolor': ftr['color'],
@@ -29,7 +44,6 @@ def _convert_benchling_features(benchling_seq):
         if info['type'].strip() == '':
             info['type'] = 'misc'
         info = copy.deepcopy(info)
-        encode_dictionary(info)
         seqfeature = SeqFeature(**info)
         seqfeatures.append(seqfeature)
     return seqfeatures
@@ -54,16 +68,14 @@ def benchling_to_seqrecord(benchling_seq):
         'description': '\n'.join([bseq['name'], bseq['description']]),
         'dbxrefs': bseq['aliases'],
         'features': features,
-        'annotations': {'full_name': bseq['name'].encode('utf-8')},
+        'annotations': {'full_name': bseq['name']},
         'letter_annotations': None,
         'name': str(bseq['name'][:10]),
         'id': bseq['id']
     }
+    if bseq.get('circular'):
+        kwargs['annotations']['topology'] = 'circular'
     kwargs = copy.deepcopy(kwargs)
-    encode_dictionary(kwargs)
-    for key in kwargs:
-        if isinstance(kwargs[key], str):
-            kwargs[key] = kwargs[key].encode('utf-8')
     seqrec = SeqRecord(seq, **kwargs)
     _clean_seqrecord_features(seqrec)
     return seqrec
@@ -83,6 +95,13 @@ def _get_benchlingfeatures_from_seqrecord(seqrec):
 
         start = location.start.position
         end = location.end.position
+        if len(location.parts) > 1:
+            # join spanning the origin of a circular sequence
+            tail = [p for p in location.parts if p.end == len(seqrec.seq)]
+            head = [p for p in location.parts if p.start == 0]
+            if tail and head:
+                start = tail[0].start.position
+                end = head[0].end.position
         type = feature.type
         strand = feature.strand
         if strand not in [-1, 1]:
@@ -94,7 +113,12 @@ def _get_benchlingfeatures_from_seqrecord(seqrec):
         try:
             color = qualifiers['color']
         except:
-            color = '#F58A5E'
+            color = qualifiers.get('ApEinfo_fwdcolor', '#F58A5E')
+        # GenBank qualifiers are parsed as lists
+        if isinstance(name, list):
+            name = name[0]
+        if isinstance(color, list):
+            color = color[0]
 
         annotation = {
             'start': start,
@@ -111,14 +135,17 @@ def _seqrecord_to_benchling(seqrec, default_circular=True):
     seqrec = copy.deepcopy(seqrec)
     _clean_seqrecord_features(seqrec)
     annotations = _get_benchlingfeatures_from_seqrecord(seqrec)
-    bases = seqrec.seq.tostring()
+    bases = str(seqrec.seq)
     circular = default_circular
     assert isinstance(default_circular, bool)
-    try:
-        circular = seqrec.circular
-    except:
-        print("Could not determine topology, defaulted to {}".format(default_circular))
-        pass
+    if 'topology' in seqrec.annotations:
+        circular = seqrec.annotations['topology'] == 'circular'
+    else:
+        try:
+            circular = seqrec.circular
+        except:
+            print("Could not determine topology, defaulted to {}".format(default_circular))
+            pass
     # force with argument
     aliases = seqrec.dbxrefs
     description = seqrec.description
@@ -145,4 +172,74 @@ def _seqrecord_to_benchling(seqrec, default_circular=True):
 def save_seqrecord_to_benchling(seqrec, folder, api):
     bseq = _seqrecord_to_benchling(seqrec)
     bseq['folder'] = folder
-    api._post('sequences/', bseq)
\ No newline at end of file
+    api._post('sequences/', bseq)
+    api.response_cache.invalidate('folders/{}'.format(folder))
+
+
+def _convert_chunk(fn, chunk):
+    return [fn(item) for item in chunk]
+
+
+def _batch_convert(fn, iterable, processes=None, chunksize=64, min_batch=256):
+    """
+    Applies fn to every item, fanning chunks of items out over a process
+    pool and yielding results in order as they complete. Batches smaller
+    than min_batch are converted in-process, where the pool start-up cost
+    would outweigh the gain.
+    :param fn: picklable conversion function
+    :param iterable:
+    :param processes: number of worker processes, defaults to the number of cores
+    :param chunksize: number of items sent to a worker at once
+    :param min_batch: minimum number of items to use the process pool
+    :return: generator of converted items
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    iterator = iter(iterable)
+    head = list(itertools.islice(iterator, min_batch))
+    items = itertools.chain(head, iterator)
+    if processes <= 1 or len(head) < min_batch:
+        for item in items:
+            yield fn(item)
+        return
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        # bound the number of chunks in flight so results stream instead of piling up
+        pending = deque()
+        while True:
+            chunk = list(itertools.islice(items, chunksize))
+            if not chunk:
+                break
+            pending.append(pool.submit(_convert_chunk, fn, chunk))
+            if len(pending) >= 2 * processes:
+                for result in pending.popleft().result():
+                    yield result
+        while pending:
+            for result in pending.popleft().result():
+                yield result
+
+
+def benchling_to_seqrecords(benchling_seqs, processes=None, chunksize=64, min_batch=256):
+    """
+    Converts many Benchling sequences to SeqRecords using a process pool
+    :param benchling_seqs: iterable of Benchling sequence dictionaries
+    :param processes: number of worker processes, defaults to the number of cores
+    :param chunksize: number of sequences sent to a worker at once
+    :param min_batch: minimum number of sequences to use the process pool
+    :return: generator of SeqRecords, in input order
+    """
+    return _batch_convert(benchling_to_seqrecord, benchling_seqs,
+                          processes=processes, chunksize=chunksize, min_batch=min_batch)
+
+
+def seqrecords_to_benchling(seqrecs, default_circular=True, processes=None, chunksize=64, min_batch=256):
+    """
+    Converts many SeqRecords to Benchling sequence dictionaries using a process pool
+    :param seqrecs: iterable of SeqRecords
+    :param default_circular: topology of records without one
+    :param processes: number of worker processes, defaults to the number of cores
+    :param chunksize: number of records sent to a worker at once
+    :param min_batch: minimum number of records to use the process pool
+    :return: generator of Benchling sequence dictionaries, in input order
+    """
+    fn = functools.partial(_seqrecord_to_benchling, default_circular=default_circular)
+    return _batch_convert(fn, seqrecs, processes=processes, chunksize=chunksize, min_batch=min_batch)
@@ -0,0 +1,363 @@
+import re
+from functools import lru_cache
+
+_REPEAT = re.compile(r'\{\d*(,\d*)?\}')
+
+
+@lru_cache(maxsize=256)
+def compile_pattern(pattern):
+    """
+    Compiles a regular expression, caching the compiled pattern
+    :param pattern:
+    :return:
+    """
+    return re.compile(pattern)
+
+
+def _trigrams(text):
+    """
+    Returns the set of trigrams in a string
+    :param text:
+    :return:
+    """
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def _escape_end(pattern, i):
+    """
+    Position just after the escape sequence starting with the backslash at i,
+    e.g. \\x31, \\u0031, \\U00000031, \\061 or \\N{DIGIT ONE}
+    :param pattern:
+    :param i:
+    :return:
+    """
+    c = pattern[i + 1:i + 2]
+    if c in ['x', 'u', 'U']:
+        return i + 2 + {'x': 2, 'u': 4, 'U': 8}[c]
+    if c == 'N' and pattern[i + 2:i + 3] == '{':
+        end = pattern.find('}', i)
+        return len(pattern) if end == -1 else end + 1
+    if c.isdigit():
+        # octal escapes and group references have up to three digits
+        j = i + 1
+        while j < len(pattern) and j < i + 4 and pattern[j].isdigit():
+            j += 1
+        return j
+    return i + 2
+
+
+def _required_literals(pattern):
+    """
+    Conservatively extracts literal substrings that must appear in any
+    string matched by the regular expression. Returns an empty list if
+    nothing can be guaranteed (e.g. top-level alternation or inline flags).
+    :param pattern:
+    :return:
+    """
+    if pattern.startswith('(?'):
+        return []
+    literals = []
+    run = ''
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            if depth == 0:
+                literals.append(run)
+                run = ''
+            i = _escape_end(pattern, i)
+            continue
+        if c == '[':
+            # skip the whole character class
+            if depth == 0:
+                literals.append(run)
+                run = ''
+            i += 1
+            if i < len(pattern) and pattern[i] == '^':
+                i += 1
+            if i < len(pattern) and pattern[i] == ']':
+                i += 1
+            while i < len(pattern) and pattern[i] != ']':
+                if pattern[i] == '\\':
+                    i += 1
+                i += 1
+            i += 1
+            continue
+        if c == '(':
+            if depth == 0:
+                literals.append(run)
+                run = ''
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif c == '|':
+            if depth == 0:
+                return []
+        elif depth > 0:
+            pass
+        elif c in '*?':
+            # the previous character is optional
+            literals.append(run[:-1])
+            run = ''
+        elif c == '{':
+            repeat = _REPEAT.match(pattern, i)
+            if repeat is None:
+                # a literal brace; it still breaks the run to stay conservative
+                literals.append(run)
+                run = ''
+            else:
+                # skip the whole {m,n} quantifier; the previous character may repeat zero times
+                literals.append(run[:-1])
+                run = ''
+                i = repeat.end()
+                continue
+        elif c in '.^$+':
+            literals.append(run)
+            run = ''
+        else:
+            run += c
+        i += 1
+    literals.append(run)
+    return [l for l in literals if l]
+
+
+class TrigramIndex(object):
+    """
+    Index over a list of cached items (folders or sequences) used to narrow
+    down candidates before running exact, substring or regular expression
+    filters
+    """
+
+    TRIGRAM_FIELDS = ('name', 'description', 'aliases')
+    EXACT_FIELDS = ('id', 'name', 'description', 'folder')
+
+    def __init__(self, items):
+        """
+        Builds the index
+        :param items: list of dictionaries
+        """
+        self.items = items
+        self._values = {f: {} for f in self.EXACT_FIELDS}
+        self._grams = {f: {} for f in self.TRIGRAM_FIELDS}
+        for pos, item in enumerate(items):
+            for field in self.EXACT_FIELDS:
+                value = item.get(field)
+                if isinstance(value, str):
+                    self._values[field].setdefault(value, []).append(pos)
+            for field in self.TRIGRAM_FIELDS:
+                value = item.get(field)
+                if isinstance(value, str):
+                    value = [value]
+                elif not isinstance(value, list):
+                    continue
+                grams = set()
+                for v in value:
+                    if isinstance(v, str):
+                        grams.update(_trigrams(v))
+                for g in grams:
+                    self._grams[field].setdefault(g, set()).add(pos)
+
+    def _substring_positions(self, field, substring):
+        """
+        Positions of items whose field may contain the substring, or None
+        if the index cannot narrow down the search
+        :param field:
+        :param substring:
+        :return:
+        """
+        if field not in self._grams or len(substring) < 3:
+            return None
+        postings = self._grams[field]
+        result = None
+        for g in sorted(_trigrams(substring), key=lambda g: len(postings.get(g, ()))):
+            positions = postings.get(g)
+            if not positions:
+                return set()
+            result = set(positions) if result is None else result & positions
+            if not result:
+                break
+        return result
+
+    def _positions(self, field, value, regex=False):
+        """
+        Candidate positions for a single field query, or None if the index
+        cannot narrow down the search
+        :param field:
+        :param value:
+        :param regex:
+        :return:
+        """
+        if not regex:
+            if field in self._values and isinstance(value, str):
+                return set(self._values[field].get(value, ()))
+            return None
+        if not isinstance(value, str):
+            return None
+        result = None
+        for literal in _required_literals(value):
+            positions = self._substring_positions(field, literal)
+            if positions is None:
+                continue
+            result = positions if result is None else result & positions
+            if not result:
+                break
+        return result
+
+    def candidates(self, fields, regex=False):
+        """
+        Returns the items that may match all fields, in their original order.
+        Candidates still need to be checked against the actual query.
+        :param fields:
+        :param regex:
+        :return:
+        """
+        result = None
+        for key in fields:
+            positions = self._positions(key, fields[key], regex=regex)
+            if positions is None:
+                continue
+            result = positions if result is None else result & positions
+            if not result:
+                return []
+        if result is None:
+            return self.items
+        return [self.items[pos] for pos in sorted(result)]
+
+    def contains(self, field, substring):
+        """
+        Returns items whose field contains the substring
+        :param field:
+        :param substring:
+        :return:
+        """
+        positions = self._substring_positions(field, substring)
+        if positions is None:
+            candidates = self.items
+        else:
+            candidates = [self.items[pos] for pos in sorted(positions)]
+        found = []
+        for item in candidates:
+            value = item.get(field)
+            if isinstance(value, str):
+                value = [value]
+            elif not isinstance(value, list):
+                continue
+            if any(isinstance(v, str) and substring in v for v in value):
+                found.append(item)
+        return found
+
+
+class AnnotationIndex(object):
+    """
+    Interval index over the annotations of a sequence for positional queries.
+    Coordinates are 0-based with exclusive ends, as in Benchling annotations.
+    An end of 0 means the annotation runs to the end of the sequence, and on
+    circular sequences an annotation (or query) with start > end wraps around
+    the origin. Queries return annotations in their original order.
+    """
+
+    def __init__(self, sequence):
+        """
+        Builds the index from a fetched sequence
+        :param sequence: Benchling sequence dictionary with bases and annotations
+        """
+        self.annotations = sequence['annotations']
+        self.length = len(sequence['bases'])
+        self.circular = bool(sequence.get('circular'))
+        self._pieces = [self._split(a['start'], a['end'], query=False) for a in self.annotations]
+        intervals = sorted((start, end, pos)
+                           for pos, pieces in enumerate(self._pieces)
+                           for start, end in pieces)
+        self._starts = [i[0] for i in intervals]
+        self._ends = [i[1] for i in intervals]
+        self._positions = [i[2] for i in intervals]
+        # max end of each implicit subtree, rooted at the middle of each range
+        self._max_end = [0] * len(intervals)
+        self._build(0, len(intervals))
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return -1
+        mid = (lo + hi) // 2
+        m = max(self._ends[mid], self._build(lo, mid), self._build(mid + 1, hi))
+        self._max_end[mid] = m
+        return m
+
+    def _split(self, start, end, query=True):
+        """
+        Splits a range into linear pieces, wrapping around the origin if needed
+        :param start:
+        :param end:
+        :param query: whether to reject wrapping query ranges on linear sequences
+        :return:
+        """
+        if end == 0:
+            end = self.length
+        if start <= end:
+            return [(start, end)] if start < end else []
+        if query and not self.circular:
+            raise ValueError("Range {}-{} wraps around the origin of a linear sequence".format(start, end))
+        return [(s, e) for s, e in [(start, self.length), (0, end)] if s < e]
+
+    def _overlapping_positions(self, start, end):
+        found = set()
+        for a, b in self._split(start, end):
+            stack = [(0, len(self._starts))]
+            while stack:
+                lo, hi = stack.pop()
+                if lo >= hi:
+                    continue
+                mid = (lo + hi) // 2
+                if self._max_end[mid] <= a:
+                    continue
+                stack.append((lo, mid))
+                if self._starts[mid] < b:
+                    if self._ends[mid] > a:
+                        found.add(self._positions[mid])
+                    stack.append((mid + 1, hi))
+        return sorted(found)
+
+    def overlapping(self, start, end):
+        """
+        Annotations overlapping the range start-end
+        :param start:
+        :param end:
+        :return:
+        """
+        return [self.annotations[p] for p in self._overlapping_positions(start, end)]
+
+    def at(self, position):
+        """
+        Annotations covering a position
+        :param position:
+        :return:
+        """
+        if self.circular:
+            position %= self.length
+        return self.overlapping(position, position + 1)
+
+    def within(self, start, end):
+        """
+        Annotations that lie entirely within the range start-end
+        :param start:
+        :param end:
+        :return:
+        """
+        query = self._split(start, end)
+        return [self.annotations[p] for p in self._overlapping_positions(start, end)
+                if all(any(qs <= s and e <= qe for qs, qe in query) for s, e in self._pieces[p])]
+
+    def containing(self, start, end):
+        """
+        Annotations that entirely contain the range start-end
+        :param start:
+        :param end:
+        :return:
+        """
+        query = self._split(start, end)
+        return [self.annotations[p] for p in self._overlapping_positions(start, end)
+                if all(any(s <= qs and qe <= e for s, e in self._pieces[p]) for qs, qe in query)]
+
+    def __len__(self):
+        return len(self.annotations)
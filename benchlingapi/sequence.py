@@ -0,0 +1,97 @@
+import copy
+import threading
+
+
+class SequenceHandle(dict):
+    """
+    A sequence returned from cached lookups. Starts with the cached metadata
+    (id, name, folder) and fetches the full sequence (bases, annotations, ...)
+    through the api the first time a key or attribute that is not cached is
+    accessed, or when the handle is iterated, copied or serialized (keys,
+    items, values, len, `in`, json.dumps, copy.deepcopy, pickle). Once loaded,
+    the handle holds the same data as get_sequence, except that folder stays
+    the folder id; copies and pickles of a handle are plain dictionaries.
+    """
+
+    def __init__(self, api, metadata):
+        dict.__init__(self, metadata)
+        self._api = api
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def load(self):
+        """
+        Fetches the full sequence, if not already loaded
+        :return:
+        """
+        with self._lock:
+            if not self.loaded:
+                sequence = self._api.get_sequence(dict.__getitem__(self, 'id'))
+                if dict.__contains__(self, 'folder'):
+                    # get_sequence returns the folder as {'id', 'name'}
+                    sequence['folder'] = dict.__getitem__(self, 'folder')
+                self.update(sequence)
+                self.loaded = True
+        return self
+
+    @property
+    def annotation_index(self):
+        """
+        Interval index over the annotations of the sequence
+        :return: AnnotationIndex
+        """
+        return self._api.annotation_index(self.load())
+
+    def __missing__(self, key):
+        if self.loaded:
+            raise KeyError(key)
+        self.load()
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        if dict.__contains__(self, key) or self.loaded:
+            return dict.__contains__(self, key)
+        return dict.__contains__(self.load(), key)
+
+    def __iter__(self):
+        return dict.__iter__(self.load())
+
+    def __len__(self):
+        return dict.__len__(self.load())
+
+    def keys(self):
+        return dict.keys(self.load())
+
+    def items(self):
+        return dict.items(self.load())
+
+    def values(self):
+        return dict.values(self.load())
+
+    def copy(self):
+        return dict(self.load())
+
+    def __reduce__(self):
+        # handles hold the api and a lock, so they pickle as the loaded sequence
+        return dict, (self.copy(),)
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self.copy(), memo)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __repr__(self):
+        return '<SequenceHandle {} {!r}{}>'.format(
+            dict.get(self, 'id'), dict.get(self, 'name'), '' if self.loaded else ' (not loaded)')
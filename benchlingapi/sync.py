@@ -0,0 +1,405 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from Bio import SeqIO
+
+from .convert import benchling_to_seqrecord, write_to_gb, _seqrecord_to_benchling
+
+MANIFEST = 'manifest.json'
+GENBANK_EXTENSIONS = ('.gb', '.gbk', '.genbank')
+
+
+def _modified_at(item):
+    return item.get('modified_at', item.get('modifiedAt'))
+
+
+def _write_json(path, obj):
+    """
+    Writes json to a temporary file and moves it into place so that an
+    interrupted write never leaves a truncated file behind
+    :param path:
+    :param obj:
+    :return:
+    """
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as handle:
+        json.dump(obj, handle)
+    os.replace(tmp, path)
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def _load_manifest(dest_dir):
+    path = os.path.join(dest_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {'folders': {}, 'sequences': {}}
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def _fetch_sequence(api, seq_id, entry=None):
+    """
+    Fetches a sequence bypassing the response cache. If the manifest entry
+    has validators the request is conditional and the sequence is None when
+    it has not changed.
+    :param api: BenchlingAPI
+    :param seq_id:
+    :param entry: manifest entry of the sequence
+    :return: (sequence or None, response)
+    """
+    headers = {}
+    if entry is not None:
+        if entry.get('etag') is not None:
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified') is not None:
+            headers['If-Modified-Since'] = entry['last_modified']
+    r = api._get_response('sequences/{}'.format(seq_id), headers=headers)
+    if r.status_code == 304:
+        return None, r
+    sequence = json.loads(r.text)
+    api._clean_annotations(sequence)
+    return sequence, r
+
+
+def mirror(api, dest_dir, max_workers=None, genbank=True, prune=True, full=False, revalidate=True,
+           checkpoint_every=25):
+    """
+    Mirrors every folder and sequence of the account to dest_dir.
+
+    Layout:
+        dest_dir/manifest.json
+        dest_dir/folders/<folder_id>.json
+        dest_dir/sequences/<seq_id>.json
+        dest_dir/sequences/<seq_id>.gb
+
+    Progress is checkpointed to the manifest, so an interrupted mirror
+    resumes where it stopped. On later runs a sequence is only downloaded
+    again if it changed: its modified_at in the folder listing differs, or,
+    when the listing has none, a conditional request with the ETag or
+    Last-Modified validators saved in the manifest says so. Sequences whose
+    folder changed are always rechecked.
+
+    :param api: BenchlingAPI
+    :param dest_dir: destination directory
+    :param max_workers: number of concurrent sequence fetches, defaults to api.max_workers
+    :param genbank: whether to also write GenBank files
+    :param prune: whether to remove local files for entities no longer in the account
+    :param full: refetch every sequence regardless of the manifest
+    :param revalidate: recheck sequences of unchanged folders with conditional requests.
+        Without it, sequences edited in place are only noticed once their
+        folder's modified_at changes.
+    :param checkpoint_every: number of sequences between manifest checkpoints
+    :return: report dictionary
+    """
+    if max_workers is None:
+        max_workers = api.max_workers
+    folder_dir = os.path.join(dest_dir, 'folders')
+    seq_dir = os.path.join(dest_dir, 'sequences')
+    for d in [folder_dir, seq_dir]:
+        if not os.path.isdir(d):
+            os.makedirs(d)
+    manifest_path = os.path.join(dest_dir, MANIFEST)
+    manifest = _load_manifest(dest_dir)
+    report = {'fetched': [], 'skipped': 0, 'removed': [], 'failed': {}, 'genbank_failed': {}}
+
+    api.update()
+    folders = list(api.folders)
+    pending = {}  # folder_id: set of seq ids still to fetch or check
+    todo = []  # (folder_id, folder version, seq_id, manifest entry to validate against)
+    for folder in folders:
+        fid = folder['id']
+        version = _modified_at(folder)
+        previous = manifest['folders'].get(fid)
+        if full or previous is None or previous['modified_at'] != version:
+            _write_json(os.path.join(folder_dir, '{}.json'.format(fid)), folder)
+            manifest['folders'][fid] = {'modified_at': version, 'complete': False}
+        pending[fid] = set()
+        for s in folder['sequences']:
+            entry = manifest['sequences'].get(s['id'])
+            if full or entry is None:
+                entry = None
+            elif _modified_at(s) is not None:
+                if _modified_at(s) == entry['modified_at']:
+                    report['skipped'] += 1
+                    continue
+                entry = None
+            elif entry.get('folder_version') == version and not revalidate:
+                # fetched since the folder last changed
+                report['skipped'] += 1
+                continue
+            pending[fid].add(s['id'])
+            todo.append((fid, version, s['id'], entry))
+
+    def checkpoint():
+        for fid in pending:
+            manifest['folders'][fid]['complete'] = not pending[fid]
+        _write_json(manifest_path, manifest)
+
+    checkpoint()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_fetch_sequence, api, seq_id, entry): (fid, version, seq_id)
+                   for fid, version, seq_id, entry in todo}
+        for n, future in enumerate(as_completed(futures), 1):
+            fid, version, seq_id = futures[future]
+            try:
+                sequence, r = future.result()
+            except Exception as e:
+                report['failed'][seq_id] = str(e)
+                continue
+            if sequence is None:
+                manifest['sequences'][seq_id]['folder_version'] = version
+                report['skipped'] += 1
+            else:
+                _write_json(os.path.join(seq_dir, '{}.json'.format(seq_id)), sequence)
+                if genbank:
+                    try:
+                        write_to_gb(benchling_to_seqrecord(sequence), os.path.join(seq_dir, '{}.gb'.format(seq_id)))
+                    except Exception as e:
+                        report['genbank_failed'][seq_id] = str(e)
+                manifest['sequences'][seq_id] = {
+                    'folder': fid,
+                    'folder_version': version,
+                    'modified_at': _modified_at(sequence),
+                    'etag': r.headers.get('ETag'),
+                    'last_modified': r.headers.get('Last-Modified'),
+                }
+                report['fetched'].append(seq_id)
+            pending[fid].discard(seq_id)
+            if n % checkpoint_every == 0:
+                checkpoint()
+
+    if prune:
+        folder_ids = set(f['id'] for f in folders)
+        seq_ids = set(s['id'] for f in folders for s in f['sequences'])
+        for fid in [fid for fid in manifest['folders'] if fid not in folder_ids]:
+            manifest['folders'].pop(fid)
+            _remove(os.path.join(folder_dir, '{}.json'.format(fid)))
+            report['removed'].append(fid)
+        for seq_id in [seq_id for seq_id in manifest['sequences'] if seq_id not in seq_ids]:
+            manifest['sequences'].pop(seq_id)
+            for ext in ['json', 'gb']:
+                _remove(os.path.join(seq_dir, '{}.{}'.format(seq_id, ext)))
+            report['removed'].append(seq_id)
+    checkpoint()
+    return report
+
+
+def _canonical_annotations(bseq):
+    """
+    Order independent, comparable form of a sequence's annotations
+    :param bseq:
+    :return:
+    """
+    length = len(bseq['bases'])
+    annotations = []
+    for a in bseq.get('annotations') or []:
+        end = a['end']
+        if end == 0:
+            end = length
+        annotations.append([int(a['start']), int(end), int(a.get('strand') or 1),
+                            (a.get('type') or '').strip() or 'misc', a.get('name') or '',
+                            (a.get('color') or '').lower()])
+    return sorted(annotations)
+
+
+def _canonical_fields(bseq):
+    return {
+        'bases': bseq['bases'].lower(),
+        'circular': bool(bseq['circular']),
+        # GenBank DEFINITION lines do not keep line breaks
+        'description': ' '.join((bseq.get('description') or '').split()),
+        'aliases': sorted(set(bseq.get('aliases') or [])),
+        'annotations': _canonical_annotations(bseq),
+    }
+
+
+def sequence_digest(bseq):
+    """
+    Hash of the bases, annotations (including their colors) and metadata
+    (name, topology, description and aliases) of a Benchling sequence
+    dictionary, used to detect which sequences differ
+    :param bseq:
+    :return:
+    """
+    fields = _canonical_fields(bseq)
+    fields['name'] = bseq['name']
+    return hashlib.sha1(json.dumps(fields, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def read_genbank_dir(local_dir):
+    """
+    Reads GenBank files from a directory as Benchling sequence dictionaries.
+    The file name without extension is used as the sequence name, since
+    GenBank LOCUS names are truncated.
+    :param local_dir:
+    :return: dictionary of name: (path, sequence dictionary)
+    """
+    local = {}
+    for filename in sorted(os.listdir(local_dir)):
+        name, ext = os.path.splitext(filename)
+        if ext.lower() not in GENBANK_EXTENSIONS:
+            continue
+        path = os.path.join(local_dir, filename)
+        local[name] = (path, _read_genbank(path))
+    return local
+
+
+def _read_genbank(path):
+    record = SeqIO.read(path, 'genbank')
+    bseq = _seqrecord_to_benchling(record)
+    bseq['name'] = os.path.splitext(os.path.basename(path))[0]
+    # _seqrecord_to_benchling adds the record id, which is not an alias of the file
+    bseq['aliases'] = sorted(set(record.dbxrefs))
+    # benchling_to_seqrecord writes the name in front of the description
+    description = bseq['description']
+    if description == bseq['name'] or description.startswith(bseq['name'] + ' '):
+        description = description[len(bseq['name']):]
+    bseq['description'] = description.strip()
+    return bseq
+
+
+def _current_sequence(api, seq_id):
+    """
+    Gets a sequence, revalidating any cached copy so that it reflects the
+    current server state
+    :param api: BenchlingAPI
+    :param seq_id:
+    :return:
+    """
+    sequence = api._cached_get('sequences/{}'.format(seq_id), revalidate=True)
+    api._clean_annotations(sequence)
+    return sequence
+
+
+def plan_folder_sync(api, local_dir, folder_id, delete=True, max_workers=None):
+    """
+    Compares a directory of GenBank files with a Benchling folder and
+    returns the list of actions needed to make the folder match.
+
+    Each action is a dictionary with keys 'action' (create, patch, replace,
+    delete or unchanged), 'name', 'id' (remote id), 'path' (local file) and
+    'fields' (differing fields). Annotations cannot be patched, so sequences
+    with different annotations are replaced.
+    :param api: BenchlingAPI
+    :param local_dir:
+    :param folder_id:
+    :param delete: whether to delete remote sequences that have no local file
+    :param max_workers:
+    :return: list of actions
+    """
+    if max_workers is None:
+        max_workers = api.max_workers
+    local = read_genbank_dir(local_dir)
+    listing = api.get_folder(folder_id)['sequences']
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        remote_sequences = list(pool.map(lambda id: _current_sequence(api, id), [s['id'] for s in listing]))
+
+    plan = []
+    seen = set()
+    for remote in remote_sequences:
+        name = remote['name']
+        if name not in local or name in seen:
+            if delete:
+                plan.append(dict(action='delete', name=name, id=remote['id'], path=None, fields=[]))
+            continue
+        seen.add(name)
+        path, bseq = local[name]
+        if sequence_digest(bseq) == sequence_digest(remote):
+            action, fields = 'unchanged', []
+        else:
+            l, r = _canonical_fields(bseq), _canonical_fields(remote)
+            fields = sorted(k for k in l if l[k] != r[k])
+            action = 'replace' if 'annotations' in fields else 'patch'
+        plan.append(dict(action=action, name=name, id=remote['id'], path=path, fields=fields))
+    for name in local:
+        if name not in seen:
+            plan.append(dict(action='create', name=name, id=None, path=local[name][0], fields=[]))
+    return plan
+
+
+def format_plan(plan):
+    """
+    Human readable summary of a sync plan
+    :param plan:
+    :return:
+    """
+    lines = []
+    for a in plan:
+        if a['action'] == 'unchanged':
+            continue
+        line = '{:<8} {} ({})'.format(a['action'], a['name'], a['id'] or a['path'])
+        if a['fields']:
+            line += ' [{}]'.format(', '.join(a['fields']))
+        lines.append(line)
+    counts = {}
+    for a in plan:
+        counts[a['action']] = counts.get(a['action'], 0) + 1
+    lines.append(', '.join('{} {}'.format(n, k) for k, n in sorted(counts.items())))
+    return '\n'.join(lines)
+
+
+def sync_folder(api, local_dir, folder_id, dry_run=False, delete=True, max_workers=None):
+    """
+    Makes a Benchling folder match a directory of GenBank files, only
+    creating, patching or deleting the sequences that differ. Replaced
+    sequences are only deleted once their replacement has been created.
+    :param api: BenchlingAPI
+    :param local_dir:
+    :param folder_id:
+    :param dry_run: only compute the plan
+    :param delete: whether to delete remote sequences that have no local file
+    :param max_workers:
+    :return: dictionary with the 'plan' and any 'failed' actions by name
+    """
+    if max_workers is None:
+        max_workers = api.max_workers
+    plan = plan_folder_sync(api, local_dir, folder_id, delete=delete, max_workers=max_workers)
+    report = {'plan': plan, 'failed': {}}
+    if dry_run:
+        return report
+
+    changes = [a for a in plan if a['action'] != 'unchanged']
+    names = {a['id']: a['name'] for a in changes if a['id'] is not None}
+    deleted = api.delete_sequences([a['id'] for a in changes if a['action'] == 'delete'],
+                                   max_workers=max_workers)
+    patches = []
+    for a in changes:
+        if a['action'] == 'patch':
+            bseq = _read_genbank(a['path'])
+            patches.append((a['id'], {f: bseq[f] for f in a['fields']}))
+    patched = api.patch_sequences(patches, max_workers=max_workers)
+    for id, message in list(deleted['failed'].items()) + list(patched['failed'].items()):
+        report['failed'][names[id]] = message
+
+    def create(action):
+        payload = _read_genbank(action['path'])
+        payload['folder'] = folder_id
+        api._post('sequences/', api._clean_dictionary(payload))
+
+    # replacements are created before the sequences they replace are deleted,
+    # so a failed create never loses the remote sequence
+    creates = [a for a in changes if a['action'] in ['create', 'replace']]
+    replaced = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(create, a): a for a in creates}
+        for future in as_completed(futures):
+            action = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                report['failed'][action['name']] = str(e)
+                continue
+            if action['action'] == 'replace':
+                replaced.append(action['id'])
+    deleted = api.delete_sequences(replaced, max_workers=max_workers)
+    for id, message in deleted['failed'].items():
+        report['failed'][names[id]] = 'Created the replacement but could not delete {}: {}'.format(id, message)
+    if changes:
+        api.response_cache.invalidate('folders/{}'.format(folder_id))
+        api.update()
+    return report
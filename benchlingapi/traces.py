@@ -0,0 +1,90 @@
+import base64
+import os
+
+from Bio import SeqIO
+
+
+def mott_trim(qualities, cutoff=0.05):
+    """
+    Finds the high quality region of a read with Richard Mott's trimming
+    algorithm: the segment with the highest sum of (cutoff - error probability)
+    :param qualities: phred quality scores
+    :param cutoff: error probability cutoff
+    :return: (start, end) of the region to keep
+    """
+    best_start = best_end = 0
+    best = score = 0
+    start = 0
+    for i, q in enumerate(qualities):
+        score += cutoff - 10 ** (-q / 10.0)
+        if score < 0:
+            score = 0
+            start = i + 1
+        elif score > best:
+            best = score
+            best_start, best_end = start, i + 1
+    return best_start, best_end
+
+
+class TracePreprocessor(object):
+    """
+    Prepares Sanger trace (.ab1) files for alignment locally: quality trims
+    each read, drops reads that fail, and encodes the trimmed read as FASTA
+    or FASTQ, which is much smaller than the full trace.
+    """
+
+    EXTENSIONS = ('.ab1', '.abi')
+
+    def __init__(self, cutoff=0.05, min_length=50, min_mean_quality=20, fmt='fasta'):
+        """
+        TracePreprocessor constructor
+        :param cutoff: error probability cutoff for trimming
+        :param min_length: reads shorter than this after trimming are dropped
+        :param min_mean_quality: reads with a lower mean phred quality after trimming are dropped
+        :param fmt: 'fasta' or 'fastq'
+        """
+        if fmt not in ['fasta', 'fastq']:
+            raise ValueError("Format must be 'fasta' or 'fastq', not {}".format(fmt))
+        self.cutoff = cutoff
+        self.min_length = min_length
+        self.min_mean_quality = min_mean_quality
+        self.fmt = fmt
+
+    @classmethod
+    def accepts(cls, path):
+        return os.path.splitext(path)[1].lower() in cls.EXTENSIONS
+
+    def trim(self, record):
+        """
+        Quality trims a trace record
+        :param record: SeqRecord with phred_quality letter annotations
+        :return: trimmed SeqRecord
+        """
+        start, end = mott_trim(record.letter_annotations['phred_quality'], cutoff=self.cutoff)
+        return record[start:end]
+
+    def passes(self, record):
+        """
+        Whether a trimmed read is good enough to align
+        :param record:
+        :return:
+        """
+        qualities = record.letter_annotations['phred_quality']
+        if len(qualities) < max(self.min_length, 1):
+            return False
+        return sum(qualities) / float(len(qualities)) >= self.min_mean_quality
+
+    def __call__(self, path):
+        """
+        Trims a trace file
+        :param path: path to an .ab1 file
+        :return: (name, base64 encoded data) for submit_alignment, or None if the read failed
+        """
+        record = self.trim(SeqIO.read(path, 'abi'))
+        if not self.passes(record):
+            return None
+        name = os.path.splitext(os.path.basename(path))[0]
+        record.id = name
+        record.description = ''
+        data = record.format(self.fmt).encode('utf-8')
+        return '{}.{}'.format(name, self.fmt), base64.b64encode(data).decode('ascii')
@@ -0,0 +1,53 @@
+"""
+Benchmarks batch conversion in convert.py across process counts.
+
+    python benchmarks/convert_scaling.py [number of sequences]
+"""
+import copy
+import json
+import os
+import sys
+import time
+import warnings
+
+from benchlingapi.convert import benchling_to_seqrecords, seqrecords_to_benchling
+
+warnings.simplefilter('ignore')
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'example_outputs', 'example_sequence.json')
+
+
+def sequences(n):
+    with open(EXAMPLE) as handle:
+        example = json.load(handle)
+    for i in range(n):
+        s = copy.deepcopy(example)
+        s['id'] = 'seq_{}'.format(i)
+        yield s
+
+
+def timeit(fn):
+    start = time.time()
+    fn()
+    return time.time() - start
+
+
+def main(n):
+    seqs = list(sequences(n))
+    records = list(benchling_to_seqrecords(seqs, processes=1))
+    cores = os.cpu_count() or 1
+    counts = sorted(set([1, 2, 4, 8, cores]) & set(range(1, cores + 1)))
+    print('{} sequences, {} cores'.format(n, cores))
+    print('{:>9} {:>24} {:>24}'.format('processes', 'benchling_to_seqrecords', 'seqrecords_to_benchling'))
+    base = None
+    for processes in counts:
+        to_records = timeit(lambda: list(benchling_to_seqrecords(seqs, processes=processes, min_batch=0)))
+        to_benchling = timeit(lambda: list(seqrecords_to_benchling(records, processes=processes, min_batch=0)))
+        if base is None:
+            base = (to_records, to_benchling)
+        print('{:>9} {:>15.2f}s ({:>4.1f}x) {:>15.2f}s ({:>4.1f}x)'.format(
+            processes, to_records, base[0] / to_records, to_benchling, base[1] / to_benchling))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
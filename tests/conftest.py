@@ -2,6 +2,7 @@ import pytest
 from benchlingapi import BenchlingAPI
 import os
 import json
+import copy
 
 @pytest.fixture
 def config(scope="module"):
@@ -12,4 +13,115 @@ def config(scope="module"):
 
 @pytest.fixture(scope="module")
 def api():
-    return BenchlingAPI(**config()["credentials"])
\ No newline at end of file
+    return BenchlingAPI(**config()["credentials"])
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.text = '' if body is None else json.dumps(body)
+        self.headers = headers or {}
+
+
+class FakeBenchling(object):
+    """
+    Minimal in-memory stand-in for the Benchling API routes used by the offline tests
+    """
+
+    def __init__(self, home):
+        self.home = home
+        test_dir = os.path.dirname(os.path.abspath(__file__))
+        with open(os.path.join(test_dir, "example_outputs/example_sequence.json")) as handle:
+            sequence = json.load(handle)
+        self.folders = {
+            'lib_1': {'id': 'lib_1', 'name': 'Plasmids', 'description': '',
+                      'modified_at': '2017-01-20T21:57:55+00:00', 'sequences': []},
+        }
+        self.sequences = {}
+        for i in range(3):
+            s = copy.deepcopy(sequence)
+            s['id'] = 'seq_{}'.format(i)
+            s['name'] = 'pGPT4-pGAL1-{}'.format(i)
+            s['folder'] = {'id': 'lib_1', 'name': 'Plasmids'}
+            self.sequences[s['id']] = s
+            self.folders['lib_1']['sequences'].append({'id': s['id'], 'name': s['name']})
+        self.tasks = {}
+        self.alignments = {}
+        self.calls = []
+        self.fail = set()
+
+    def _path(self, url):
+        return url[len(self.home):].strip('/')
+
+    def get(self, url, json=None, auth=None, headers=None, **kwargs):
+        path = self._path(url)
+        self.calls.append(('GET', path))
+        if path in self.fail:
+            return FakeResponse(500)
+        if path == 'folders':
+            return FakeResponse(200, {'folders': list(self.folders.values())})
+        what, id = path.split('/')
+        items = getattr(self, what)
+        if id not in items:
+            return FakeResponse(404)
+        etag = '"{}-{}"'.format(id, items[id].get('modified_at', items[id].get('modifiedAt')))
+        if headers and headers.get('If-None-Match') == etag:
+            return FakeResponse(304, headers={'ETag': etag})
+        return FakeResponse(200, items[id], headers={'ETag': etag})
+
+    def patch(self, url, json=None, auth=None, **kwargs):
+        path = self._path(url)
+        self.calls.append(('PATCH', path))
+        if path in self.fail:
+            return FakeResponse(500)
+        what, id = path.split('/')
+        items = getattr(self, what)
+        items[id].update(json)
+        items[id]['modifiedAt'] = items[id]['modified_at'] = str(len(self.calls))
+        return FakeResponse(200, items[id])
+
+    def delete(self, url, auth=None, **kwargs):
+        path = self._path(url)
+        self.calls.append(('DELETE', path))
+        if path in self.fail:
+            return FakeResponse(500)
+        what, id = path.split('/')
+        getattr(self, what).pop(id)
+        for f in self.folders.values():
+            f['sequences'] = [s for s in f['sequences'] if s['id'] != id]
+        return FakeResponse(200, {})
+
+    def post(self, url, json=None, auth=None, **kwargs):
+        path = self._path(url)
+        self.calls.append(('POST', path))
+        if path in self.fail:
+            return FakeResponse(500)
+        if path == 'sequences':
+            s = dict(json)
+            s['id'] = 'seq_new{}'.format(len(self.calls))
+            s['folder'] = {'id': json['folder']}
+            self.sequences[s['id']] = s
+            self.folders[json['folder']]['sequences'].append({'id': s['id'], 'name': s['name']})
+            return FakeResponse(200, s)
+        if path == 'alignments':
+            task_id = 'task_{}'.format(len(self.calls))
+            self.tasks[task_id] = {'id': task_id, 'status': 'RUNNING'}
+            return FakeResponse(200, {'taskId': task_id})
+        return FakeResponse(200, {})
+
+    def count(self, method, path):
+        return self.calls.count((method, path))
+
+
+@pytest.fixture
+def fake_benchling(monkeypatch):
+    home = 'https://api.benchling.com/v1/'
+    server = FakeBenchling(home)
+    for method in ['get', 'patch', 'delete', 'post']:
+        monkeypatch.setattr('benchlingapi.benchlingapi.requests.{}'.format(method), getattr(server, method))
+    return server
+
+
+@pytest.fixture
+def offline_api(fake_benchling):
+    return BenchlingAPI('fake_key', alignment_cache=':memory:')
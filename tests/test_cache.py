@@ -0,0 +1,76 @@
+from benchlingapi.cache import ResponseCache
+
+
+def test_lru_evicts_by_size():
+    cache = ResponseCache(max_bytes=10)
+    cache.put('sequences/a', 'sequences/a', '"aaaa"')
+    cache.put('sequences/b', 'sequences/b', '"bb"')
+    cache.get('sequences/a')
+    cache.put('sequences/c', 'sequences/c', '"cc"')
+    assert cache.get('sequences/b') is None
+    assert cache.get('sequences/a') is not None
+    assert cache.size <= 10
+    cache.put('sequences/d', 'sequences/d', '"{}"'.format('x' * 20))
+    assert cache.get('sequences/d') is None
+
+
+def test_ttls_and_invalidation():
+    cache = ResponseCache(ttls={'folders': 0})
+    cache.put('folders/f', 'folders/f', '{}', modified_at='1')
+    cache.put(cache.key('sequences/s', {'x': 1}), 'sequences/s', '{}')
+    assert cache.get('folders/f').expired()
+    cache.revalidate('folders/f', '1')
+    cache.invalidate('sequences/s')
+    assert len(cache) == 1
+    cache.revalidate('folders/f', '2')
+    assert len(cache) == 0
+
+
+def test_cached_get_sequence(offline_api, fake_benchling):
+    s1 = offline_api.get_sequence('seq_0')
+    s1['bases'] = ''
+    s2 = offline_api.get_sequence('seq_0')
+    assert s2['bases'] != ''
+    assert fake_benchling.count('GET', 'sequences/seq_0') == 1
+
+    offline_api.patch_sequence('seq_0', name='renamed')
+    assert offline_api.get_sequence('seq_0')['name'] == 'renamed'
+    assert fake_benchling.count('GET', 'sequences/seq_0') == 2
+
+
+def test_cached_get_revalidates(fake_benchling):
+    from benchlingapi import BenchlingAPI
+    api = BenchlingAPI('fake_key', cache_ttls={'sequences': 0}, alignment_cache=':memory:')
+    api.get_sequence('seq_1')
+    assert api.get_sequence('seq_1')['id'] == 'seq_1'
+    assert fake_benchling.count('GET', 'sequences/seq_1') == 2
+
+
+def test_refresh_swaps_snapshot(offline_api, fake_benchling):
+    import threading
+    import time
+    snapshot = offline_api._snapshot
+    sequences = offline_api.sequences
+    fake_benchling.delete(fake_benchling.home + 'sequences/seq_0')
+    errors = []
+
+    def read():
+        for _ in range(200):
+            if not offline_api.filter_sequences({'name': 'pGPT4'}, regex=True):
+                errors.append('empty')
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    for _ in range(20):
+        offline_api.update()
+    reader.join()
+    assert errors == []
+    assert offline_api._snapshot is not snapshot
+    assert len(sequences) == 3
+    assert len(offline_api.sequences) == 2
+
+    fake_benchling.delete(fake_benchling.home + 'sequences/seq_1')
+    offline_api.start_refresher(0.05)
+    time.sleep(0.3)
+    offline_api.stop_refresher()
+    assert [s['id'] for s in offline_api.sequences] == ['seq_2']
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchlingapi import BenchlingAPIException
+from benchlingapi.concurrency import SingleFlight
+
+
+def test_single_flight_shares_result():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return object()
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        results = list(pool.map(lambda _: flight.do('k', slow), range(5)))
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+    assert flight.in_flight() == 0
+
+
+def test_single_flight_propagates_errors():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.2)
+        raise ValueError('boom')
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        leader = pool.submit(flight.do, 'k', fail)
+        started.wait()
+        waiters = [pool.submit(flight.do, 'k', fail) for _ in range(2)]
+        for f in [leader] + waiters:
+            with pytest.raises(ValueError):
+                f.result()
+
+
+def test_coalesced_get_sequence(offline_api, fake_benchling, monkeypatch):
+    get = fake_benchling.get
+
+    def slow_get(*args, **kwargs):
+        time.sleep(0.2)
+        return get(*args, **kwargs)
+
+    monkeypatch.setattr('benchlingapi.benchlingapi.requests.get', slow_get)
+    offline_api.response_cache.clear()
+
+    loop = asyncio.new_event_loop()
+    try:
+        futures = [offline_api.run_async(offline_api.get_sequence, 'seq_0', loop=loop) for _ in range(4)]
+        sequences = loop.run_until_complete(asyncio.gather(*futures))
+    finally:
+        loop.close()
+    assert [s['id'] for s in sequences] == ['seq_0'] * 4
+    assert fake_benchling.count('GET', 'sequences/seq_0') == 1
+
+    async def fetch():
+        return await offline_api.run_async(offline_api.get_sequence, 'seq_0')
+    assert asyncio.run(fetch())['id'] == 'seq_0'
+
+    fake_benchling.fail.add('sequences/seq_1')
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(offline_api.get_sequence, 'seq_1') for _ in range(3)]
+        for f in futures:
+            with pytest.raises(BenchlingAPIException):
+                f.result()
+
+
+def test_hedged_call():
+    from benchlingapi.concurrency import hedged_call
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return 'slow'
+        return 'fast'
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        start = time.time()
+        assert hedged_call(pool, fn, 0.05) == 'fast'
+        assert time.time() - start < 0.4
+        assert hedged_call(pool, lambda: 'quick', 0.05) == 'quick'
+
+
+def test_circuit_breaker_serves_stale_cache(fake_benchling):
+    import warnings
+    from benchlingapi import BenchlingAPI, CircuitOpenError
+    api = BenchlingAPI('fake_key', cache_ttls={'sequences': 0}, failure_threshold=2, reset_timeout=0.2,
+                       alignment_cache=':memory:')
+    api.get_sequence('seq_0')
+    fake_benchling.fail.update(['sequences/seq_0', 'sequences/seq_1'])
+    with warnings.catch_warnings(record=True):
+        warnings.simplefilter('always')
+        assert api.get_sequence('seq_0')['id'] == 'seq_0'
+        with pytest.raises(BenchlingAPIException):
+            api.get_sequence('seq_1')
+        assert api.breaker.state == 'open'
+        calls = len(fake_benchling.calls)
+        assert api.get_sequence('seq_0')['id'] == 'seq_0'
+        with pytest.raises(CircuitOpenError):
+            api.get_sequence('seq_1')
+        assert len(fake_benchling.calls) == calls
+
+    fake_benchling.fail.clear()
+    time.sleep(0.25)
+    assert api.get_sequence('seq_1')['id'] == 'seq_1'
+    assert api.breaker.state == 'closed'
+
+
+def test_circuit_breaker_reopens_after_unexpected_error(fake_benchling, monkeypatch):
+    from benchlingapi import BenchlingAPI, CircuitOpenError
+    api = BenchlingAPI('fake_key', cache_size=0, failure_threshold=1, reset_timeout=0.1,
+                       alignment_cache=':memory:')
+    fake_benchling.fail.add('sequences/seq_0')
+    with pytest.raises(BenchlingAPIException):
+        api.get_sequence('seq_0')
+    assert api.breaker.state == 'open'
+
+    def broken_get(*args, **kwargs):
+        raise ValueError('broken adapter')
+    monkeypatch.setattr('benchlingapi.benchlingapi.requests.get', broken_get)
+    time.sleep(0.15)
+    with pytest.raises(ValueError):
+        api.get_sequence('seq_0')
+    assert api.breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        api.get_sequence('seq_0')
+
+    monkeypatch.setattr('benchlingapi.benchlingapi.requests.get', fake_benchling.get)
+    fake_benchling.fail.clear()
+    time.sleep(0.15)
+    assert api.get_sequence('seq_0')['id'] == 'seq_0'
+    assert api.breaker.state == 'closed'
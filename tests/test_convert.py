@@ -0,0 +1,29 @@
+import copy
+import json
+import os
+
+from benchlingapi.convert import benchling_to_seqrecords, seqrecords_to_benchling
+
+
+def _sequences(n):
+    path = os.path.join(os.path.dirname(__file__), 'example_outputs', 'example_sequence.json')
+    with open(path) as handle:
+        example = json.load(handle)
+    for i in range(n):
+        s = copy.deepcopy(example)
+        s['id'] = 'seq_{}'.format(i)
+        s['bases'] = s['bases'][i:]
+        s['annotations'] = [a for a in s['annotations'] if a['start'] >= i]
+        yield s
+
+
+def test_batch_conversion_in_order():
+    seqs = list(_sequences(20))
+    in_process = list(benchling_to_seqrecords(seqs))
+    pooled = list(benchling_to_seqrecords(iter(seqs), processes=2, chunksize=3, min_batch=0))
+    assert [r.id for r in pooled] == [s['id'] for s in seqs]
+    assert [str(r.seq) for r in pooled] == [str(r.seq) for r in in_process]
+
+    bseqs = list(seqrecords_to_benchling(pooled, processes=2, chunksize=3, min_batch=0))
+    assert [b['bases'] for b in bseqs] == [s['bases'] for s in seqs]
+    assert [len(b['annotations']) for b in bseqs] == [len(s['annotations']) for s in seqs]
@@ -0,0 +1,106 @@
+import pytest
+from benchlingapi import BenchlingAPI
+from benchlingapi.index import TrigramIndex, _required_literals
+
+
+@pytest.fixture
+def items():
+    return [
+        {'id': 'seq_1', 'name': 'pMODU6-pGALZ4-iaaH', 'folder': 'lib_1'},
+        {'id': 'seq_2', 'name': 'pGPT4-pGAL1-EGFP', 'folder': 'lib_1', 'aliases': ['egfp-plasmid']},
+        {'id': 'seq_3', 'name': 'pLAB1', 'folder': 'lib_2', 'description': 'lab plasmid'},
+    ]
+
+
+def test_required_literals():
+    assert _required_literals('.+pGAL1.*') == ['pGAL1']
+    assert _required_literals('pGAL(Z4)?-iaaH') == ['pGAL', '-iaaH']
+    assert _required_literals('pMODU6s?') == ['pMODU6']
+    assert _required_literals('EGFP|iaaH') == []
+    assert _required_literals('(?i)egfp') == []
+    assert _required_literals('ab{10,20}xyz') == ['a', 'xyz']
+    assert _required_literals('a.{3}bcd') == ['a', 'bcd']
+    assert _required_literals('pGAL{1,2}abc') == ['pGA', 'abc']
+    assert _required_literals('pGAL\\x31-EGFP') == ['pGAL', '-EGFP']
+    assert _required_literals('pGAL\\N{DIGIT ONE}-EGFP') == ['pGAL', '-EGFP']
+
+
+@pytest.mark.parametrize('fields,regex', [
+    ({'name': '.+pGAL1.*'}, True),
+    ({'name': 'pGAL'}, True),
+    ({'name': '^pLAB\\d$'}, True),
+    ({'name': 'EGFP|iaaH'}, True),
+    ({'name': 'pGAL[ZN]4'}, True),
+    ({'name': 'ia{1,2}H'}, True),
+    ({'name': 'pG{1,2}PT4'}, True),
+    ({'name': 'p.{3}1'}, True),
+    ({'name': 'pGAL{0,}Z4-iaaH'}, True),
+    ({'name': 'pGAL\\x31-EGFP'}, True),
+    ({'name': 'pGAL\\u0031-EGFP'}, True),
+    ({'name': 'pGAL\\U00000031-EGFP'}, True),
+    ({'name': 'pGAL\\061-EGFP'}, True),
+    ({'name': 'pGAL\\N{DIGIT ONE}-EGFP'}, True),
+    ({'name': 'pLAB1'}, False),
+    ({'id': 'seq_2', 'folder': 'lib_1'}, False),
+    ({'folder': 'lib_3'}, False),
+])
+def test_filter_with_index_matches_scan(items, fields, regex):
+    index = TrigramIndex(items)
+    expected = BenchlingAPI._filter(items, fields, regex=regex)
+    assert BenchlingAPI._filter(items, fields, regex=regex, index=index) == expected
+
+
+def test_contains(items):
+    index = TrigramIndex(items)
+    assert index.contains('name', 'pGAL') == items[:2]
+    assert index.contains('aliases', 'egfp') == [items[1]]
+    assert index.contains('description', 'plasmid') == [items[2]]
+    assert index.contains('name', 'xyz') == []
+
+
+@pytest.fixture
+def sequence():
+    annotations = [
+        {'name': 'a', 'start': 0, 'end': 10},
+        {'name': 'b', 'start': 5, 'end': 50},
+        {'name': 'origin', 'start': 90, 'end': 5},
+        {'name': 'tail', 'start': 80, 'end': 0},
+        {'name': 'c', 'start': 20, 'end': 30},
+    ]
+    return {'bases': 'a' * 100, 'circular': True, 'annotations': annotations}
+
+
+def _names(annotations):
+    return [a['name'] for a in annotations]
+
+
+def test_annotation_index(sequence):
+    from benchlingapi.index import AnnotationIndex
+    index = AnnotationIndex(sequence)
+    assert _names(index.at(7)) == ['a', 'b']
+    assert _names(index.at(95)) == ['origin', 'tail']
+    assert _names(index.at(102)) == ['a', 'origin']
+    assert _names(index.overlapping(25, 85)) == ['b', 'tail', 'c']
+    assert _names(index.overlapping(95, 3)) == ['a', 'origin', 'tail']
+    assert _names(index.within(0, 40)) == ['a', 'c']
+    assert _names(index.within(85, 10)) == ['a', 'origin']
+    assert _names(index.containing(22, 28)) == ['b', 'c']
+    assert _names(index.containing(92, 2)) == ['origin']
+
+
+def test_annotation_index_matches_scan():
+    import random
+    from benchlingapi.index import AnnotationIndex
+    rng = random.Random(0)
+    annotations = []
+    for i in range(300):
+        start = rng.randrange(1000)
+        annotations.append({'name': i, 'start': start, 'end': min(1000, start + rng.randrange(1, 200))})
+    index = AnnotationIndex({'bases': 'a' * 1000, 'circular': False, 'annotations': annotations})
+    for _ in range(200):
+        a = rng.randrange(1000)
+        b = min(1000, a + rng.randrange(1, 100))
+        expected = [x for x in annotations if x['start'] < b and x['end'] > a]
+        assert index.overlapping(a, b) == expected
+    with pytest.raises(ValueError):
+        index.overlapping(900, 10)
@@ -78,4 +78,142 @@ def test_exports(api):
     with open(os.path.abspath("tests/example_outputs/example_sequence.json"), "w") as handle:
         f = api.sequences[0]
         sequence = api.get_sequence(f['id'])
-        json.dump(sequence, handle)
\ No newline at end of file
+        json.dump(sequence, handle)
+
+def test_bulk_delete_and_patch(offline_api, fake_benchling):
+    fake_benchling.fail.add('sequences/seq_1')
+    report = offline_api.delete_sequences(['seq_0', 'seq_1'])
+    assert report['succeeded'] == ['seq_0']
+    assert list(report['failed']) == ['seq_1']
+    assert [s['id'] for s in offline_api.sequences] == ['seq_1', 'seq_2']
+    assert not offline_api.sequence_exists('seq_0', query='id')
+
+    report = offline_api.patch_sequences([('seq_1', {'name': 'a'}), ('seq_2', {'name': 'b', 'bases': None})])
+    assert report['succeeded'] == ['seq_2']
+    assert offline_api.find_sequence('b')['name'] == 'b'
+    assert offline_api.folder_dict['Plasmids'][0]['sequences'][1]['name'] == 'b'
+
+    report = offline_api.patch_folders([('lib_1', {'name': 'Constructs'})])
+    assert report['succeeded'] == ['lib_1']
+    assert offline_api.folder_exists('Constructs')
+
+
+def test_bulk_uses_shared_executor(fake_benchling, monkeypatch):
+    import asyncio
+    import threading
+    from benchlingapi import BenchlingAPI
+    api = BenchlingAPI('fake_key', max_workers=1, alignment_cache=':memory:')
+    threads = set()
+    delete = fake_benchling.delete
+
+    def record_delete(*args, **kwargs):
+        threads.add(threading.current_thread().name)
+        return delete(*args, **kwargs)
+    monkeypatch.setattr('benchlingapi.benchlingapi.requests.delete', record_delete)
+
+    assert api.delete_sequences(['seq_0'])['succeeded'] == ['seq_0']
+    assert all(name.startswith(BenchlingAPI.EXECUTOR_THREAD_PREFIX) for name in threads)
+
+    # bulk operations run from the executor itself do not deadlock
+    async def delete_async():
+        return await api.run_async(api.delete_sequences, ['seq_1', 'seq_2'])
+    assert asyncio.run(delete_async())['succeeded'] == ['seq_1', 'seq_2']
+
+
+def test_lazy_sequences(offline_api, fake_benchling):
+    handle = offline_api.find_sequence('pGPT4-pGAL1-1', lazy=True)
+    assert handle['name'] == 'pGPT4-pGAL1-1'
+    assert handle.folder == 'lib_1'
+    assert fake_benchling.count('GET', 'sequences/seq_1') == 0
+    assert len(handle.bases) == 6085
+    assert handle.loaded
+    assert len(handle['annotations']) > 0
+    assert handle.folder == 'lib_1'
+    assert fake_benchling.count('GET', 'sequences/seq_1') == 1
+
+    # iterating or serializing a handle loads it first
+    handle = offline_api.find_sequence('pGPT4-pGAL1-0', lazy=True)
+    assert 'id' in handle and not handle.loaded
+    assert json.loads(json.dumps(handle))['bases'] == handle['bases']
+    assert 'annotations' in handle
+    assert fake_benchling.count('GET', 'sequences/seq_0') == 1
+
+    handles = offline_api.filter_sequences({'name': 'pGAL1'}, regex=True, lazy=True)
+    assert [h['id'] for h in handles] == ['seq_0', 'seq_1', 'seq_2']
+    assert not any(h.loaded for h in handles)
+
+    metadata = offline_api.get_sequence('seq_2', metadata_only=True)
+    assert metadata == {'id': 'seq_2', 'name': 'pGPT4-pGAL1-2', 'folder': 'lib_1'}
+    assert fake_benchling.count('GET', 'sequences/seq_2') == 0
+
+
+def test_lazy_sequences_copy_and_pickle(offline_api, fake_benchling):
+    import copy
+    import pickle
+    from benchlingapi.convert import benchling_to_seqrecords
+    handle = offline_api.find_sequence('pGPT4-pGAL1-1', lazy=True)
+    copied = copy.deepcopy(handle)
+    assert type(copied) is dict
+    assert copied == offline_api.find_sequence('pGPT4-pGAL1-1', lazy=True).load()
+    assert pickle.loads(pickle.dumps(handle)) == copied
+
+    handles = offline_api.filter_sequences({'name': 'pGAL1'}, regex=True, lazy=True)
+    records = list(benchling_to_seqrecords(handles, processes=2, min_batch=0))
+    assert [len(r.seq) for r in records] == [len(h['bases']) for h in handles]
+
+
+def test_annotation_index_cached(offline_api):
+    handle = offline_api.find_sequence('pGPT4-pGAL1-0', lazy=True)
+    index = handle.annotation_index
+    assert index is offline_api.annotation_index('seq_0')
+    for a in index.at(3200):
+        assert a['start'] <= 3200 < a['end']
+
+
+def test_alignment_cache(fake_benchling, tmpdir):
+    from benchlingapi import BenchlingAPI
+    path = str(tmpdir.join('alignments.sqlite'))
+    trace = os.path.join(os.path.dirname(__file__), 'test_data',
+                         'B0015_DG___SampleID-17872_ItemID-88381_PrimerID-16756-PrimerName-DVA_seq_F.ab1')
+    api = BenchlingAPI('fake_key', alignment_cache=path)
+    response = api.submit_mafft_alignment('seq_0', [trace, 'seq_1'])
+    assert api.submit_mafft_alignment('seq_0', [trace, 'seq_1']) == response
+    assert fake_benchling.count('POST', 'alignments') == 1
+
+    # options are part of the key
+    api.submit_mafft_alignment('seq_0', [trace, 'seq_1'], retree=1)
+    assert fake_benchling.count('POST', 'alignments') == 2
+
+    fake_benchling.tasks[response['taskId']].update(status='SUCCEEDED', response={'id': 'seqanl_1'})
+    fake_benchling.alignments['seqanl_1'] = {'id': 'seqanl_1', 'alignedSequences': []}
+    api = BenchlingAPI('fake_key', alignment_cache=path)
+    assert api.submit_mafft_alignment('seq_0', [trace, 'seq_1'])['id'] == 'seqanl_1'
+    assert api.submit_mafft_alignment('seq_0', [trace, 'seq_1'])['id'] == 'seqanl_1'
+    assert fake_benchling.count('GET', 'alignments/seqanl_1') == 1
+    assert fake_benchling.count('POST', 'alignments') == 2
+
+    # a new template version is resubmitted
+    api.patch_sequence('seq_0', name='renamed')
+    api.submit_mafft_alignment('seq_0', [trace, 'seq_1'])
+    assert fake_benchling.count('POST', 'alignments') == 3
+
+    # even if it was edited elsewhere while the template is cached
+    fake_benchling.sequences['seq_0'].update(bases='acgt', modifiedAt='edited', modified_at='edited')
+    api.submit_mafft_alignment('seq_0', [trace, 'seq_1'])
+    assert fake_benchling.count('POST', 'alignments') == 4
+
+    # expired tasks and entries without a task are resubmitted once
+    fake_benchling.tasks.clear()
+    with pytest.warns(UserWarning, match='Resubmitting alignment'):
+        api.submit_mafft_alignment('seq_0', [trace, 'seq_1'])
+    api.submit_mafft_alignment('seq_0', [trace, 'seq_1'])
+    assert fake_benchling.count('POST', 'alignments') == 5
+    data = {'algorithm': 'mafft', 'algorithmOptions': {}, 'files': [{'id': 'seq_2'}, {'id': 'seq_1'}]}
+    api.alignment_cache.put(api.alignment_cache.key(api._alignment_key_parts(data)), None, {})
+    api.submit_alignment('seq_2', ['seq_1'], 'mafft', {})
+    assert fake_benchling.count('POST', 'alignments') == 6
+
+    # entries are not shared between accounts
+    other = BenchlingAPI('other_key', alignment_cache=path)
+    other.submit_mafft_alignment('seq_0', [trace, 'seq_1'])
+    assert fake_benchling.count('POST', 'alignments') == 7
@@ -0,0 +1,125 @@
+import json
+import os
+
+
+def test_mirror_resumes_and_skips_unchanged(offline_api, fake_benchling, tmpdir):
+    dest = str(tmpdir)
+    fake_benchling.fail.add('sequences/seq_1')
+    report = offline_api.mirror(dest)
+    assert sorted(report['fetched']) == ['seq_0', 'seq_2']
+    assert list(report['failed']) == ['seq_1']
+    assert os.path.exists(os.path.join(dest, 'sequences', 'seq_0.gb'))
+    with open(os.path.join(dest, 'sequences', 'seq_0.json')) as handle:
+        assert json.load(handle)['id'] == 'seq_0'
+
+    # resume only fetches what failed
+    fake_benchling.fail.clear()
+    report = offline_api.mirror(dest)
+    assert report['fetched'] == ['seq_1']
+    assert report['skipped'] == 2
+
+    # unchanged folder is skipped entirely
+    report = offline_api.mirror(dest)
+    assert report['fetched'] == []
+    assert report['skipped'] == 3
+
+    # sequences edited in place are refetched
+    offline_api.patch_sequence('seq_0', bases='acgt')
+    report = offline_api.mirror(dest)
+    assert report['fetched'] == ['seq_0']
+    with open(os.path.join(dest, 'sequences', 'seq_0.json')) as handle:
+        assert json.load(handle)['bases'] == 'acgt'
+    calls = len(fake_benchling.calls)
+    report = offline_api.mirror(dest, revalidate=False)
+    assert report['fetched'] == []
+    assert fake_benchling.calls[calls:] == [('GET', 'folders')]
+
+    # deleted sequences are pruned after the folder changes
+    fake_benchling.delete(fake_benchling.home + 'sequences/seq_2')
+    fake_benchling.folders['lib_1']['modified_at'] = 'changed'
+    report = offline_api.mirror(dest)
+    assert report['fetched'] == []
+    assert report['skipped'] == 2
+    assert report['removed'] == ['seq_2']
+    assert not os.path.exists(os.path.join(dest, 'sequences', 'seq_2.json'))
+
+
+def test_mirror_resumes_changed_folder(offline_api, fake_benchling, tmpdir):
+    dest = str(tmpdir)
+    offline_api.mirror(dest)
+
+    # the folder and a sequence change, then the mirror is interrupted
+    fake_benchling.sequences['seq_1']['bases'] = 'acgt'
+    fake_benchling.sequences['seq_1']['modified_at'] = 'changed'
+    fake_benchling.folders['lib_1']['modified_at'] = 'changed'
+    fake_benchling.fail.add('sequences/seq_1')
+    report = offline_api.mirror(dest, revalidate=False)
+    assert list(report['failed']) == ['seq_1']
+
+    # resuming still rechecks sequences mirrored before the folder changed
+    fake_benchling.fail.clear()
+    report = offline_api.mirror(dest, revalidate=False)
+    assert report['fetched'] == ['seq_1']
+    with open(os.path.join(dest, 'sequences', 'seq_1.json')) as handle:
+        assert json.load(handle)['bases'] == 'acgt'
+
+
+def test_sync_folder(offline_api, fake_benchling, tmpdir):
+    from benchlingapi.convert import benchling_to_seqrecord, write_to_gb
+    from benchlingapi.sync import format_plan
+    local_dir = str(tmpdir)
+    for seq_id in ['seq_0', 'seq_1', 'seq_2']:
+        s = offline_api.get_sequence(seq_id)
+        if seq_id == 'seq_1':
+            s['bases'] = s['bases'][:-10]
+            s['annotations'] = [a for a in s['annotations'] if a['end'] <= len(s['bases'])][1:]
+        if seq_id == 'seq_0':
+            s['description'] = 'edited'
+            s['aliases'] = ['pGPT4-0']
+        if seq_id == 'seq_2':
+            s['name'] = 'new_construct'
+        write_to_gb(benchling_to_seqrecord(s), os.path.join(local_dir, s['name'] + '.gb'))
+
+    report = offline_api.sync_folder(local_dir, 'lib_1', dry_run=True)
+    plan = {a['name']: a for a in report['plan']}
+    assert plan['pGPT4-pGAL1-2']['action'] == 'delete'
+    assert plan['new_construct']['action'] == 'create'
+    assert plan['pGPT4-pGAL1-1']['action'] == 'replace'
+    assert plan['pGPT4-pGAL1-1']['fields'] == ['annotations', 'bases']
+    assert plan['pGPT4-pGAL1-0']['action'] == 'patch'
+    assert plan['pGPT4-pGAL1-0']['fields'] == ['aliases', 'description']
+    assert 'create' in format_plan(report['plan'])
+    assert not [c for c in fake_benchling.calls if c[0] != 'GET']
+
+    report = offline_api.sync_folder(local_dir, 'lib_1')
+    assert report['failed'] == {}
+    assert fake_benchling.sequences['seq_0']['description'] == 'edited'
+    report = offline_api.sync_folder(local_dir, 'lib_1', dry_run=True)
+    assert set(a['action'] for a in report['plan']) == {'unchanged'}
+
+    # edits made on the server while sequences are cached are noticed
+    fake_benchling.sequences['seq_0'].update(description='edited on server', modified_at='edited')
+    report = offline_api.sync_folder(local_dir, 'lib_1', dry_run=True)
+    plan = {a['name']: a for a in report['plan']}
+    assert plan['pGPT4-pGAL1-0']['action'] == 'patch'
+    assert plan['pGPT4-pGAL1-0']['fields'] == ['description']
+    report = offline_api.sync_folder(local_dir, 'lib_1')
+    assert fake_benchling.sequences['seq_0']['description'] == 'edited'
+    assert 'seq_1' not in fake_benchling.sequences
+    report = offline_api.sync_folder(local_dir, 'lib_1', dry_run=True)
+    assert set(a['action'] for a in report['plan']) == {'unchanged'}
+
+
+def test_sync_folder_keeps_sequence_if_replacement_fails(offline_api, fake_benchling, tmpdir):
+    from benchlingapi.convert import benchling_to_seqrecord, write_to_gb
+    local_dir = str(tmpdir)
+    s = offline_api.get_sequence('seq_1')
+    s['annotations'] = s['annotations'][1:]
+    write_to_gb(benchling_to_seqrecord(s), os.path.join(local_dir, s['name'] + '.gb'))
+
+    fake_benchling.fail.add('sequences')
+    report = offline_api.sync_folder(local_dir, 'lib_1', delete=False)
+    assert [a['action'] for a in report['plan'] if a['name'] == s['name']] == ['replace']
+    assert list(report['failed']) == [s['name']]
+    assert 'seq_1' in fake_benchling.sequences
+    assert ('DELETE', 'sequences/seq_1') not in fake_benchling.calls
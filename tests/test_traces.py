@@ -0,0 +1,43 @@
+import base64
+import glob
+import os
+
+import pytest
+from Bio import SeqIO
+
+from benchlingapi import BenchlingAPIException
+from benchlingapi.traces import TracePreprocessor, mott_trim
+
+TRACES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'test_data', '*.ab1')))
+
+
+def test_mott_trim():
+    assert mott_trim([5] * 10 + [40] * 100 + [5] * 10) == (10, 110)
+    assert mott_trim([2] * 10) == (0, 0)
+
+
+@pytest.mark.parametrize('path', TRACES)
+def test_trim_keeps_high_quality_region(path):
+    record = SeqIO.read(path, 'abi')
+    trimmed = TracePreprocessor().trim(record)
+    assert 0 < len(trimmed) < len(record)
+    assert str(trimmed.seq) in str(record.seq)
+    mean = lambda r: sum(r.letter_annotations['phred_quality']) / float(len(r))
+    assert mean(trimmed) > mean(record)
+
+
+@pytest.mark.parametrize('fmt', ['fasta', 'fastq'])
+def test_preprocess_shrinks_upload(fmt):
+    name, data = TracePreprocessor(fmt=fmt)(TRACES[0])
+    assert name.endswith('.' + fmt)
+    assert len(data) < os.path.getsize(TRACES[0]) / 20
+    assert base64.b64decode(data).decode('utf-8').startswith('>' if fmt == 'fasta' else '@')
+
+
+def test_preprocess_drops_failed_reads(offline_api, fake_benchling):
+    assert TracePreprocessor(min_length=5000)(TRACES[0]) is None
+    with pytest.warns(UserWarning, match='Dropping failed read'):
+        offline_api.submit_mafft_alignment('seq_0', TRACES, preprocess=TracePreprocessor(min_mean_quality=52))
+    with pytest.warns(UserWarning, match='Dropping failed read'):
+        with pytest.raises(BenchlingAPIException, match='No queries left'):
+            offline_api.submit_mafft_alignment('seq_0', TRACES, preprocess=TracePreprocessor(min_length=5000))